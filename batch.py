@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# run odds for many leagues at once, sharing nfl-wide data between them
+
+import multiprocessing
+import os
+from multiprocessing.pool import ThreadPool
+
+import cache
+import fetch
+from metrics import Metrics
+from player_index import PlayerIndex
+from power_rankings import ESPNSimulation
+
+
+def run_leagues(
+        jobs, year, complete_weeks, lookback, sim_count, workers=None,
+        concurrent_leagues=4, output_dir='leagues', cache_dir='http_cache',
+        index_path='player_index.json', offline=False, **kwargs
+        ):
+    # jobs is a list of (league_id, stats_id) pairs; every league shares one
+    # fetcher, response cache and player index, so schedule, defense and
+    # gamelog pages are fetched once per stats_id and season, the defense
+    # matrix is built once per stats_id, and simulation batches from every
+    # league go to one process pool; offline serves only cached pages
+    fetcher = fetch.Fetcher(
+        cache = cache.ResponseCache(cache_dir, offline = offline)
+        )
+    player_index = PlayerIndex(index_path)
+    workers = workers or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(workers)
+
+    def run_job(job):
+
+        league_id, stats_id = job
+        league_dir = os.path.join(output_dir, league_id)
+        if not os.path.isdir(league_dir):
+            os.makedirs(league_dir)
+
+        # leagues run side by side, so none of them draws a progress line
+        return ESPNSimulation(
+            league_id, stats_id, year, complete_weeks, lookback, sim_count,
+            workers = workers, fetcher = fetcher, player_index = player_index,
+            pool = pool, output_dir = league_dir, metrics = Metrics([]),
+            **kwargs
+            )
+
+    # leagues sharing a stats_id start together and reuse each other's pages
+    league_threads = ThreadPool(concurrent_leagues)
+    try:
+        simulations = league_threads.map(
+            run_job, sorted(jobs, key = lambda job: job[1]), chunksize = 1
+            )
+    finally:
+        league_threads.close()
+        pool.close()
+        pool.join()
+        player_index.save()
+        fetcher.close()
+
+    return simulations
@@ -0,0 +1,462 @@
+# -*- coding: utf-8 -*-
+# offline benchmark on a synthetic league served from generated html fixtures
+
+import argparse
+import json
+import random
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import cache
+import constants
+import engine
+import fetch
+import output
+from player_index import PlayerIndex
+from metrics import Metrics
+from power_rankings import ESPNSimulation
+
+
+NFL_TEAMS = [
+    ('Arizona Cardinals', 'ARI'), ('Atlanta Falcons', 'ATL'),
+    ('Baltimore Ravens', 'BAL'), ('Buffalo Bills', 'BUF'),
+    ('Carolina Panthers', 'CAR'), ('Chicago Bears', 'CHI'),
+    ('Cincinnati Bengals', 'CIN'), ('Cleveland Browns', 'CLE'),
+    ('Dallas Cowboys', 'DAL'), ('Denver Broncos', 'DEN'),
+    ('Detroit Lions', 'DET'), ('Green Bay Packers', 'GB'),
+    ('Houston Texans', 'HOU'), ('Indianapolis Colts', 'IND'),
+    ('Jacksonville Jaguars', 'JAC'), ('Kansas City Chiefs', 'KC'),
+    ('Los Angeles Chargers', 'LAC'), ('Los Angeles Rams', 'LAR'),
+    ('Miami Dolphins', 'MIA'), ('Minnesota Vikings', 'MIN'),
+    ('New England Patriots', 'NE'), ('New Orleans Saints', 'NO'),
+    ('New York Giants', 'NYG'), ('New York Jets', 'NYJ'),
+    ('Oakland Raiders', 'OAK'), ('Philadelphia Eagles', 'PHI'),
+    ('Pittsburgh Steelers', 'PIT'), ('San Francisco 49ers', 'SF'),
+    ('Seattle Seahawks', 'SEA'), ('Tampa Bay Buccaneers', 'TB'),
+    ('Tennessee Titans', 'TEN'), ('Washington Redskins', 'WAS'),
+    ]
+
+ROSTER_POSITIONS = [
+    'QB', 'RB', 'RB', 'WR', 'WR', 'TE', 'K', 'D/ST',
+    'RB', 'WR', 'QB', 'RB', 'WR', 'TE', 'WR', 'RB',
+    ]
+
+POSITION_MEANS = {
+    'QB': 17.0, 'RB': 10.0, 'WR': 10.0, 'TE': 7.0, 'K': 8.0, 'D/ST': 8.0
+    }
+
+
+def round_robin(count, weeks):
+    # circle method pairings, one list of (home, away) pairs per week
+    order = range(count)
+    schedule = []
+    for week in range(weeks):
+        schedule.append([
+            (order[index], order[count - 1 - index])
+            for index in range(count // 2)
+            ])
+        order = [order[0]] + [order[-1]] + order[1:-1]
+
+    return schedule
+
+
+class SyntheticLeague(object):
+    # a random league plus every page the scrapers would request for it
+
+    def __init__(
+            self, teams=12, roster_size=16, weeks_played=6, league_id='1',
+            stats_id='1', year='2017', seed=0
+            ):
+
+        self.random = random.Random(seed)
+        self.teams = teams
+        self.roster_size = roster_size
+        self.weeks_played = weeks_played
+        self.league_id = league_id
+        self.stats_id = stats_id
+        self.year = year
+        self.pages = {}
+        self.owner_names = ['Team %d' % (team + 1) for team in range(teams)]
+        # only nfl teams with a rostered skill player are known to the
+        # scrapers, so small leagues play in a smaller nfl
+        skill_players = teams * sum(
+            position != 'D/ST' for position in (
+                ROSTER_POSITIONS * roster_size
+                )[:roster_size]
+            )
+        self.nfl_teams = NFL_TEAMS[:min(len(NFL_TEAMS), skill_players) // 2 * 2]
+        self.rosters = self.build_rosters()
+        self.schedule = round_robin(teams, 13)
+        self.nfl_schedule = self.build_nfl_schedule()
+
+    def build_rosters(self):
+        # every nfl team gets a skill player before any team gets two
+        nfl_cycle = 0
+        defenses = iter(
+            self.random.sample(self.nfl_teams, len(self.nfl_teams)) * self.teams
+            )
+        rosters = []
+        for team in range(self.teams):
+            roster = []
+            for slot in range(self.roster_size):
+                position = ROSTER_POSITIONS[slot % len(ROSTER_POSITIONS)]
+                if position == 'D/ST':
+                    full_team, abbr = next(defenses)
+                    name = full_team.split(' ')[-1] + ' D/ST'
+                else:
+                    full_team, abbr = self.nfl_teams[
+                        nfl_cycle % len(self.nfl_teams)
+                        ]
+                    nfl_cycle += 1
+                    name = 'Player%d Last%02d%02d' % (slot, team, slot)
+                roster.append((name, position, full_team, abbr))
+            rosters.append(roster)
+
+        return rosters
+
+    def build_nfl_schedule(self):
+        # one game a week, and a mid-season bye week for two pairs of teams
+        weeks = []
+        teams = len(self.nfl_teams)
+        for week, pairs in enumerate(round_robin(teams, 17)):
+            games = {}
+            for index, (home, away) in enumerate(pairs):
+                if 3 < week < 12 and index in (week % len(pairs), 0):
+                    continue
+                home = self.nfl_teams[home][1]
+                away = self.nfl_teams[away][1]
+                games[home] = '@' + away
+                games[away] = home
+            weeks.append(games)
+
+        return weeks
+
+    def score(self, position):
+
+        return max(0.0, round(
+            self.random.gauss(POSITION_MEANS[position], 6.0), 1
+            ))
+
+    def add(self, url, text, final_url=None):
+
+        self.pages[url] = (final_url or url, text)
+
+        return
+
+    def build_pages(self):
+
+        self.add_standings()
+        for team in range(self.teams):
+            self.add_owner_pages(team)
+        self.add_player_pages()
+        self.add_defense_tables()
+        self.add_nfl_schedule()
+
+        return self.pages
+
+    def add_standings(self):
+
+        rows = []
+        self.records = []
+        for team, name in enumerate(self.owner_names):
+            wins = self.random.randint(0, self.weeks_played)
+            self.records.append((wins, self.weeks_played - wins))
+            rows.append(
+                '<tr class="tableBody"><td><a title="%s" '
+                'href="/ffl/clubhouse?leagueId=%s&amp;teamId=%d&amp;'
+                'seasonId=%s">%s</a></td><td>%d</td><td>%d</td></tr>'
+                % (name, self.league_id, team + 1, self.year, name, wins,
+                self.weeks_played - wins)
+                )
+        self.add(
+            'http://games.espn.go.com/ffl/standings?leagueId='
+            + self.league_id + '&seasonId=' + self.year,
+            '<html><body><table>%s</table></body></html>' % ''.join(rows)
+            )
+
+        return
+
+    def add_owner_pages(self, team):
+
+        rows = []
+        for week, pairs in enumerate(self.schedule):
+            for home, away in pairs:
+                if team in (home, away):
+                    opponent = away if team == home else home
+            if week < self.weeks_played:
+                result = 'W %.1f-%.1f' % (
+                    self.random.uniform(70, 140), self.random.uniform(70, 140)
+                    )
+            else:
+                result = 'Box'
+            rows.append(
+                '<tr><td><a target="_top" title="%s">%s</a></td>'
+                '<td><nobr><a>%s</a></nobr></td></tr>'
+                % (self.owner_names[opponent], self.owner_names[opponent],
+                result)
+                )
+        team_url = (
+            '?leagueId=' + self.league_id + '&teamId=' + str(team + 1)
+            + '&seasonId=' + self.year
+            )
+        self.add(
+            'http://games.espn.go.com/ffl/schedule' + team_url,
+            '<html><body><table>%s</table></body></html>' % ''.join(rows)
+            )
+
+        players = []
+        for name, position, full_team, abbr in self.rosters[team]:
+            players.append(
+                u'<tr class="pncPlayerRow"><td>Bench</td>'
+                u'<td><a>%s</a>, %s\xa0%s</td></tr>'
+                % (name, abbr, position)
+                )
+        self.add(
+            'http://games.espn.com/ffl/clubhouse' + team_url,
+            u'<html><body><table>%s</table></body></html>' % u''.join(players)
+            )
+
+        return
+
+    def gamelog_page(self, name, full_team, abbr, position):
+
+        tables = []
+        for year, games in ((self.year, self.weeks_played), ('prior', 16)):
+            rows = ''.join(
+                '<tr><td class="sort1">%d</td><td class="sort1">%.1f</td></tr>'
+                % (week, self.score(position))
+                for week in range(1, games + 1)
+                )
+            tables.append(
+                '<span>%s Gamelog</span><table><tr><td>Wk</td>'
+                '<td>FPts</td></tr>%s</table>' % (year, rows)
+                )
+
+        return (
+            '<html><body><table><tr><td class="update">%s, %s</td></tr>'
+            '</table><span>Season Stats</span><table><tr><td>Year</td>'
+            '<td>Team</td></tr><tr><td>%s</td><td>%s</td></tr></table>%s'
+            '</body></html>'
+            % (name, full_team, self.year, abbr, ''.join(tables))
+            )
+
+    def add_player_pages(self):
+
+        league_url = '?LeagueID=' + self.stats_id
+        defenses = []
+        for team, roster in enumerate(self.rosters):
+            for slot, (name, position, full_team, abbr) in enumerate(roster):
+                path = '/stats/players/%d%02d/%s' % (
+                    team, slot, name.replace(' ', '_').replace('/', '')
+                    )
+                if position == 'D/ST':
+                    defenses.append(
+                        '<tr><td class="sort1"><a href="%s?LeagueID=">%s</a>'
+                        '</td></tr>' % (path, full_team)
+                        )
+                    self.add(
+                        'http://www.fftoday.com' + path + '?LeagueID='
+                        + self.stats_id,
+                        self.gamelog_page(name, full_team, abbr, position)
+                        )
+                    continue
+                last_name = name[name.find(' ') + 1:]
+                self.add(
+                    'http://www.fftoday.com/stats/players?Search=' + last_name,
+                    '<html><body><span class="bodycontent"><a href="%s">'
+                    '%s, %s, %s</a></span></body></html>'
+                    % (path, name, position, full_team)
+                    )
+                self.add(
+                    'http://fftoday.com' + path + league_url,
+                    self.gamelog_page(name, full_team, abbr, position)
+                    )
+
+        self.add(
+            'http://www.fftoday.com/stats/playerstats.php?Season='
+            + self.year + '&PosID=99&leagueID=' + self.stats_id,
+            '<html><body><table>%s</table></body></html>' % ''.join(defenses)
+            )
+
+        return
+
+    def add_defense_tables(self):
+
+        for position, code in constants.positional_codes.iteritems():
+            for year in (int(self.year), int(self.year) - 1):
+                rows = ''.join(
+                    '<tr><td><a>%s vs. %s</a></td><td>%.1f</td></tr>'
+                    % (full_team, position,
+                    self.random.uniform(0.7, 1.3) * POSITION_MEANS[position]
+                    * 16)
+                    for full_team, abbr in self.nfl_teams
+                    )
+                self.add(
+                    'http://fftoday.com/stats/fantasystats.php?Season='
+                    + str(year) + '&GameWeek=Season&PosID=' + code
+                    + '&Side=Allowed&LeagueID=' + self.stats_id,
+                    '<html><body><table><tr class="tableclmhdr"><td>Team'
+                    '</td><td>FPts</td></tr>%s</table></body></html>' % rows
+                    )
+
+        return
+
+    def add_nfl_schedule(self):
+
+        rows = ['<tr><td align="left" class="tablehdr"><strong>Bye</strong>'
+            '</td></tr>']
+        for full_team, abbr in self.nfl_teams:
+            cells = ''.join(
+                '<td>%s</td>' % week.get(abbr, '') for week in self.nfl_schedule
+                )
+            rows.append(
+                '<tr><td align="left" class="tablehdr"><strong>%s</strong>'
+                '</td>%s</tr>' % (abbr, cells)
+                )
+        self.add(
+            'http://fftoday.com/nfl/schedule_grid_17.html',
+            '<html><body><table>%s</table></body></html>' % ''.join(rows)
+            )
+
+        return
+
+
+def write_fixtures(league, directory):
+    # record every page into a response cache directory for offline runs
+    fixtures = cache.ResponseCache(directory)
+    for url, (final_url, text) in league.build_pages().iteritems():
+        fixtures.store(url, cache.CachedResponse(final_url, unicode(text)))
+
+    return fixtures
+
+
+def run_benchmark(
+        teams=12, roster_size=16, weeks_played=6, sim_count=100000,
+        lookback=12, workers=1, seed=0, fixture_dir=None, backend='numpy',
+        check_backends=False, output_format='csv'
+        ):
+    # csv by default so finish_simulation times the run, not a spreadsheet
+
+    work_dir = tempfile.mkdtemp(prefix = 'power_rankings_bench')
+    try:
+        league = SyntheticLeague(
+            teams, roster_size, weeks_played, seed = seed
+            )
+        fixtures = write_fixtures(league, fixture_dir or work_dir)
+        fixtures.offline = True
+        page_bytes = sum(
+            len(text.encode('utf-8')) for final_url, text in league.pages.values()
+            )
+
+        start = time.time()
+        simulation = ESPNSimulation(
+            league.league_id, league.stats_id, league.year, weeks_played,
+            lookback, sim_count, seed = seed, workers = workers,
+            fetcher = fetch.Fetcher(cache = fixtures),
+            player_index = PlayerIndex(), output_dir = work_dir,
+            metrics = Metrics([]), backend = backend,
+            output_format = output_format, measure_memory = True
+            )
+        wall_time = time.time() - start
+        backend_scores = None
+        if check_backends:
+            # z scores of numba against the numpy reference on this league
+            backend_scores = dict(
+                (name, float(np.abs(scores).max()))
+                for name, scores in engine.compare_backends(
+                    simulation.build_simulator(),
+                    engine.split_batches(sim_count, simulation.batch_size)
+                    ).iteritems()
+                )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors = True)
+
+    timings = simulation.pipeline.timings
+    scrape_time = sum(
+        timings.get(stage, 0.0) for stage in (
+            'populate_owners', 'populate_stats', 'populate_defense_stats',
+            'populate_schedule'
+            )
+        )
+
+    return {
+        'teams': teams,
+        'roster_size': roster_size,
+        'weeks_played': weeks_played,
+        'sim_count': simulation.sims_run,
+        'workers': workers,
+        'backend': engine.resolve_backend(backend),
+        'wall_time': wall_time,
+        'stage_times': timings,
+        'stage_memory_mb': simulation.pipeline.memory,
+        'sims_per_second': simulation.sims_run / timings['run_simulation'],
+        'pages': len(league.pages),
+        'pages_per_second': len(league.pages) / scrape_time,
+        'page_megabytes_per_second': page_bytes / scrape_time / 1e6,
+        # stage peaks reset the high-water mark, so take the largest
+        'peak_memory_mb': max(
+            simulation.pipeline.memory.values()
+            + [resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0]
+            ),
+        'backend_max_z': backend_scores,
+        }
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description = 'Benchmark a synthetic league without network access.'
+        )
+    parser.add_argument('--teams', type = int, default = 12)
+    parser.add_argument('--roster-size', type = int, default = 16)
+    parser.add_argument('--weeks-played', type = int, default = 6)
+    parser.add_argument('--sims', type = int, default = 100000)
+    parser.add_argument('--workers', type = int, default = 1)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument(
+        '--backend', default = 'numpy', choices = engine.KERNEL_BACKENDS
+        )
+    parser.add_argument(
+        '--check-backends', action = 'store_true',
+        help = 'also compare the numba kernel with numpy on the same league'
+        )
+    parser.add_argument(
+        '--output-format', default = 'csv', choices = sorted(output.WRITERS)
+        )
+    parser.add_argument(
+        '--fixtures', help = 'keep the generated fixtures in this directory'
+        )
+    parser.add_argument('--json', help = 'also write the report here')
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        args.teams, args.roster_size, args.weeks_played, args.sims,
+        workers = args.workers, seed = args.seed, fixture_dir = args.fixtures,
+        backend = args.backend, check_backends = args.check_backends,
+        output_format = args.output_format
+        )
+    for stage, seconds in sorted(
+            report['stage_times'].items(), key = lambda item: -item[1]
+            ):
+        print '%-28s %9.3f s %9.1f MB' % (
+            stage, seconds, report['stage_memory_mb'][stage]
+            )
+    print '%-28s %9.0f' % ('sims/sec', report['sims_per_second'])
+    print '%-28s %9.0f' % ('pages/sec', report['pages_per_second'])
+    print '%-28s %9.2f' % ('page MB/sec', report['page_megabytes_per_second'])
+    print '%-28s %9.1f' % ('peak memory MB', report['peak_memory_mb'])
+    if report['backend_max_z'] is not None:
+        # the largest of many z scores, so around 3 to 4 is expected
+        for name, score in sorted(report['backend_max_z'].items()):
+            print '%-28s %9.2f' % ('max |z| numba ' + name, score)
+    if args.json:
+        with open(args.json, 'w') as report_file:
+            json.dump(report, report_file, indent = 1, sort_keys = True)
+
+
+if __name__ == '__main__':
+    main()
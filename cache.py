@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+# on-disk http response cache keyed by url
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+# (url pattern, seconds a cached page stays fresh), first match wins
+PAGE_TTLS = [
+    (r'fftoday\.com/nfl/schedule_grid', 30 * DAY),
+    (r'fftoday\.com/stats/fantasystats\.php', 2 * DAY),
+    (r'fftoday\.com/stats/playerstats\.php', 2 * DAY),
+    (r'fftoday\.com/stats/players', 2 * DAY),
+    (r'espn\.(go\.)?com/ffl/schedule', 12 * HOUR),
+    (r'espn\.(go\.)?com/ffl/standings', 12 * HOUR),
+    (r'espn\.(go\.)?com/ffl/clubhouse', 6 * HOUR),
+    ]
+
+DEFAULT_TTL = HOUR
+
+
+class OfflineCacheMiss(Exception):
+    # raised in offline mode for a url that was never cached
+
+    pass
+
+
+class CachedResponse(object):
+    # the parts of a requests response the scrapers rely on
+
+    def __init__(self, url, text, status_code=200):
+
+        self.url = url
+        self.text = text
+        self.status_code = status_code
+        self.content = text.encode('utf-8')
+
+
+class ResponseCache(object):
+
+    def __init__(
+            self, directory, max_bytes=512 * 1024 * 1024, ttls=None,
+            offline=False
+            ):
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttls = [
+            (re.compile(pattern), ttl)
+            for pattern, ttl in (PAGE_TTLS if ttls is None else ttls)
+            ]
+        self.offline = offline
+        self.lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.total_bytes = sum(
+            os.path.getsize(os.path.join(directory, name))
+            for name in os.listdir(directory)
+            )
+
+    def key(self, url):
+
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def ttl(self, url):
+
+        for pattern, ttl in self.ttls:
+            if pattern.search(url):
+                return ttl
+
+        return DEFAULT_TTL
+
+    def shortest_ttl(self):
+        # how long anything built from this cache's pages stays fresh, None
+        # offline, where stale pages are served anyway
+        if self.offline:
+            return None
+
+        return min([DEFAULT_TTL] + [ttl for pattern, ttl in self.ttls])
+
+    def paths(self, url):
+
+        key = self.key(url)
+
+        return (
+            os.path.join(self.directory, key + '.json'),
+            os.path.join(self.directory, key + '.html')
+            )
+
+    def get(self, url):
+        # None on a miss or stale page, offline serves stale pages and raises
+        # on a miss
+        meta_path, body_path = self.paths(url)
+        try:
+            with open(meta_path) as meta_file:
+                meta = json.load(meta_file)
+            with open(body_path, 'rb') as body_file:
+                text = body_file.read().decode('utf-8')
+        except (IOError, OSError, ValueError):
+            if self.offline:
+                raise OfflineCacheMiss(url)
+            return None
+
+        if not self.offline and time.time() - meta['fetched'] > self.ttl(url):
+            return None
+        os.utime(meta_path, None)
+
+        return CachedResponse(meta['final_url'], text, meta['status_code'])
+
+    def store(self, url, response):
+
+        if response.status_code != 200:
+            return
+        meta_path, body_path = self.paths(url)
+        meta = {
+            'url': url, 'final_url': response.url,
+            'status_code': response.status_code, 'fetched': time.time()
+            }
+        body = response.text.encode('utf-8')
+        meta = json.dumps(meta)
+        # an overwritten page's old files no longer count
+        replaced = self.stored_size(body_path) + self.stored_size(meta_path)
+        self.write(body_path, body)
+        self.write(meta_path, meta)
+
+        with self.lock:
+            self.total_bytes += len(body) + len(meta) - replaced
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+        return
+
+    def stored_size(self, path):
+
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def write(self, path, data):
+        # write through a temp file so readers never see half a page
+        handle, temp_path = tempfile.mkstemp(dir = self.directory)
+        with os.fdopen(handle, 'wb') as temp_file:
+            temp_file.write(data)
+        os.rename(temp_path, path)
+
+        return
+
+    def evict(self):
+        # drop least recently used pages until the cache fits in max_bytes
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                meta_path = os.path.join(self.directory, name)
+                entries.append((os.path.getmtime(meta_path), name[:-5]))
+        entries.sort()
+
+        self.total_bytes = sum(
+            os.path.getsize(os.path.join(self.directory, name))
+            for name in os.listdir(self.directory)
+            )
+        for access_time, key in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            for suffix in ('.json', '.html'):
+                path = os.path.join(self.directory, key + suffix)
+                try:
+                    self.total_bytes -= os.path.getsize(path)
+                    os.remove(path)
+                except OSError:
+                    continue
+
+        return
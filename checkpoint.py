@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# periodic .npz checkpoints of a running simulation
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+
+CHECKPOINT_VERSION = 2
+
+# manifest entries that have to match for a checkpoint to be resumed
+RUN_KEYS = (
+    'league_id', 'stats_id', 'year', 'complete_weeks', 'lookback', 'seed',
+    'sim_count', 'batch_size', 'sampling', 'target_error', 'results_mode',
+    'keep_scenarios', 'keep_impact', 'backend', 'league_digest',
+    )
+
+
+def league_digest(simulator):
+    # the arrays every batch is drawn from, so a checkpoint taken before
+    # rosters or projections changed is never mixed into a new run
+    digest = hashlib.sha1()
+    for array in (
+            simulator.lineup_scores, simulator.lineup_deviations,
+            simulator.opponents, simulator.wins, simulator.losses,
+            simulator.total_points
+            ):
+        digest.update(np.ascontiguousarray(array).tostring())
+
+    return digest.hexdigest()
+
+
+def save_checkpoint(
+        path, manifest, rank_counts, batch_squares, results_state,
+        scenario_state=None, impact_state=None
+        ):
+    # batch_squares are the batch means sums behind standard errors; the
+    # states are the results, scenario and impact stores' dicts of
+    # arrays; batches are drawn from RandomState([seed, batch index]), so
+    # the next batch index in the manifest is all the random state a
+    # resumed run needs
+    manifest = dict(
+        manifest, version = CHECKPOINT_VERSION, created = time.time()
+        )
+    arrays = dict(
+        ('results_' + name, values)
+        for name, values in results_state.iteritems()
+        )
+    for name, values in (scenario_state or {}).iteritems():
+        arrays['scenario_' + name] = values
+    for name, values in (impact_state or {}).iteritems():
+        arrays['impact_' + name] = values
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as checkpoint_file:
+        np.savez(
+            checkpoint_file,
+            manifest = np.array(json.dumps(manifest)),
+            rank_counts = rank_counts,
+            batch_squares = batch_squares,
+            **arrays
+            )
+    os.rename(temp_path, path)
+
+    return
+
+
+def read_manifest(path, data=None):
+    # npz members load lazily, so this skips the result arrays
+    if data is None:
+        data = np.load(path)
+    manifest = json.loads(data['manifest'].item())
+    if manifest['version'] != CHECKPOINT_VERSION:
+        raise ValueError(
+            'unsupported checkpoint version %s in %s'
+            % (manifest['version'], path)
+            )
+
+    return manifest
+
+
+def load_checkpoint(path):
+
+    data = np.load(path)
+
+    return {
+        'manifest': read_manifest(path, data),
+        'rank_counts': data['rank_counts'],
+        'batch_squares': data['batch_squares'],
+        'results': prefixed(data, 'results_'),
+        'scenarios': prefixed(data, 'scenario_'),
+        'impact': prefixed(data, 'impact_'),
+        }
+
+
+def prefixed(data, prefix):
+
+    return dict(
+        (name[len(prefix):], data[name])
+        for name in data.files if name.startswith(prefix)
+        )
+
+
+def check_manifest(manifest, expected, path):
+
+    for key in RUN_KEYS:
+        if manifest.get(key) != expected[key]:
+            raise ValueError(
+                'checkpoint %s was taken with %s=%r, this run has %r'
+                % (path, key, manifest.get(key), expected[key])
+                )
+
+    return
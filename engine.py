@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+# batched monte carlo engine used by Simulation.run_simulation
+
+import collections
+import copy
+
+import numpy as np
+
+import kernels
+import sobol
+
+try:
+    from scipy.special import ndtri
+except ImportError:
+    ndtri = None
+
+
+SAMPLING_MODES = ('independent', 'antithetic', 'sobol')
+# auto is numba when it is installed and numpy otherwise
+KERNEL_BACKENDS = ('numpy', 'numba', 'auto')
+
+
+def resolve_backend(backend):
+
+    if backend == 'auto':
+        return 'numpy' if kernels.numba is None else 'numba'
+    if backend == 'numba' and kernels.numba is None:
+        raise ImportError('the numba backend needs numba installed')
+    if backend not in KERNEL_BACKENDS:
+        raise ValueError('unknown kernel backend %s' % backend)
+
+    return backend
+
+
+def standard_draws(rng, shape, sampling='independent'):
+    # standard normal deviates for every (sim, owner, week, slot); the same
+    # rng and shape always give the same deviates, so two scenarios run with
+    # one seed share common random numbers slot for slot
+    if sampling == 'independent':
+        return rng.standard_normal(shape)
+
+    if sampling == 'antithetic':
+        half = rng.standard_normal(((shape[0] + 1) // 2,) + shape[1:])
+        return np.concatenate([half, -half])[:shape[0]]
+
+    if sampling == 'sobol':
+        if ndtri is None:
+            raise ImportError('sobol sampling needs scipy installed')
+        # a freshly scrambled sequence per batch keeps batches independent
+        points = sobol.scrambled_points(
+            shape[0], int(np.prod(shape[1:])), rng
+            )
+        return ndtri(points).reshape(shape)
+
+    raise ValueError('unknown sampling mode %s' % sampling)
+
+
+def draw_point_totals(
+        lineup_scores, lineup_deviations, sim_count, rng=np.random,
+        sampling='independent'
+        ):
+    # draw every remaining week of every owner's lineup in one block of
+    # shape (sims x owners x weeks x slots), negative draws count as zero,
+    # which is the inverse cdf of the zero-censored normal for sobol points
+    draws = standard_draws(
+        rng, (sim_count,) + lineup_scores.shape, sampling
+        )
+    draws *= lineup_deviations
+    draws += lineup_scores
+    np.maximum(draws, 0.0, out = draws)
+
+    return draws.sum(axis = 3)
+
+
+def play_games(weekly_points, opponents):
+    # opponents is an (owners x weeks) matrix of owner indices with -1 for
+    # weeks without a game, returns simulated (sims x owners) wins and losses
+    played = opponents >= 0
+    week_index = np.arange(opponents.shape[1])
+    opponent_points = weekly_points[:, np.maximum(opponents, 0), week_index]
+    wins = ((weekly_points > opponent_points) & played).sum(axis = 2)
+    losses = ((weekly_points < opponent_points) & played).sum(axis = 2)
+
+    return wins, losses
+
+
+def next_week_winners(weekly_points, opponents):
+    # (sims x owners) flags for winning the first remaining week's game
+    opponent_points = weekly_points[:, np.maximum(opponents[:, 0], 0), 0]
+
+    return (weekly_points[:, :, 0] > opponent_points) & (opponents[:, 0] >= 0)
+
+
+def final_ranks(rankings):
+    # (sims x owners) zero based finishing place of each owner, the inverse
+    # of the rankings permutation, small enough to keep for every sim
+    ranks = np.empty(rankings.shape, dtype=np.int8)
+    np.put_along_axis(
+        ranks, rankings,
+        np.arange(rankings.shape[1], dtype=np.int8)[np.newaxis, :], axis = 1
+        )
+
+    return ranks
+
+
+def rank_owners(win_percentages, total_points):
+    # order owners by win percentage, then total points, best first
+    return np.lexsort((-total_points, -win_percentages))
+
+
+def wild_card(rankings, total_points, division_spots=5):
+    # move the top scorer outside the division spots into the next slot
+    tail = rankings[:, division_spots:]
+    tail_points = np.take_along_axis(
+        total_points, tail, axis = 1
+        )
+    leader = tail_points.argmax(axis = 1)[:, np.newaxis]
+    slot = np.arange(tail.shape[1])[np.newaxis, :]
+    source = np.where(slot <= leader, slot - 1, slot)
+    source[:, 0] = leader[:, 0]
+    rankings[:, division_spots:] = np.take_along_axis(tail, source, axis = 1)
+
+    return rankings
+
+
+def rank_histogram(rankings):
+    # (owners x ranks) count of how often each owner finished in each slot
+    owner_count = rankings.shape[1]
+    slots = np.tile(np.arange(owner_count), rankings.shape[0])
+    counts = np.bincount(
+        rankings.ravel() * owner_count + slots,
+        minlength = owner_count * owner_count
+        )
+
+    return counts.reshape(owner_count, owner_count)
+
+
+def split_batches(sim_count, batch_size):
+    # fixed (index, size) batches so results never depend on the worker count
+    return [
+        (index, min(batch_size, sim_count - start))
+        for index, start in enumerate(range(0, sim_count, batch_size))
+        ]
+
+
+class BatchSimulator(object):
+    # holds the league arrays needed to simulate a batch of seasons
+
+    def __init__(
+            self, lineup_scores, lineup_deviations, opponents, wins, losses,
+            total_points, season_games, seed, sampling='independent',
+            keep_outcomes=False, backend='numpy', keep_points=False
+            ):
+
+        self.lineup_scores = lineup_scores
+        self.lineup_deviations = lineup_deviations
+        self.opponents = opponents
+        self.wins = wins
+        self.losses = losses
+        self.total_points = total_points
+        self.season_games = season_games
+        self.seed = seed
+        self.sampling = sampling
+        # with keep_outcomes each batch also returns every sim's final
+        # ranks and next week winners for conditional odds
+        self.keep_outcomes = keep_outcomes
+        # with keep_points also every sim's final ranks and (owners x
+        # weeks) points, for reweighting the run to other lineups
+        self.keep_points = keep_points
+        # numpy builds each batch from whole-array steps, numba runs the
+        # fused per-season kernel; both draw from the batch's seed
+        self.backend = resolve_backend(backend)
+        if self.backend == 'numba' and sampling == 'sobol':
+            raise ValueError('sobol sampling needs the numpy backend')
+
+    def batch_rng(self, batch_index):
+        # every batch gets its own stream derived from the master seed
+        return np.random.RandomState([self.seed, batch_index])
+
+    def simulate(self, batch_index, batch_size):
+        # rankings, final wins, losses and points, then next week winners
+        # and weekly points, each None unless it is kept
+        if self.backend == 'numba':
+            return self.simulate_fused(batch_index, batch_size)
+
+        weekly_points = draw_point_totals(
+            self.lineup_scores, self.lineup_deviations, batch_size,
+            self.batch_rng(batch_index), self.sampling
+            )
+        wins, losses = play_games(weekly_points, self.opponents)
+        wins += self.wins
+        losses += self.losses
+        total_points = weekly_points.sum(axis = 2) + self.total_points
+        rankings = rank_owners(wins / self.season_games, total_points)
+        wild_card(rankings, total_points)
+        next_week = None
+        if self.keep_outcomes:
+            next_week = next_week_winners(weekly_points, self.opponents)
+
+        return (
+            rankings, wins, losses, total_points, next_week,
+            weekly_points if self.keep_points else None
+            )
+
+    def simulate_fused(self, batch_index, batch_size):
+
+        owners = len(self.wins)
+        rankings = np.empty((batch_size, owners), dtype=np.int64)
+        wins = np.empty((batch_size, owners), dtype=np.int64)
+        losses = np.empty((batch_size, owners), dtype=np.int64)
+        total_points = np.empty((batch_size, owners))
+        next_week = np.empty((batch_size, owners), dtype=bool)
+        # the kernel skips weekly points when handed an empty array
+        weekly_points = np.empty(
+            (batch_size if self.keep_points else 0,) + self.opponents.shape
+            )
+        kernels.simulate_seasons(
+            np.asarray(self.lineup_scores, dtype=np.float64),
+            np.asarray(self.lineup_deviations, dtype=np.float64),
+            np.asarray(self.opponents, dtype=np.int64),
+            np.asarray(self.wins, dtype=np.int64),
+            np.asarray(self.losses, dtype=np.int64),
+            np.asarray(self.total_points, dtype=np.float64),
+            np.asarray(self.season_games, dtype=np.float64),
+            self.batch_rng(batch_index).randint(2 ** 31),
+            self.sampling == 'antithetic', 5,
+            rankings, wins, losses, total_points, next_week, weekly_points,
+            kernels.EDGES, kernels.RATIOS
+            )
+
+        return (
+            rankings, wins, losses, total_points,
+            next_week if self.keep_outcomes else None,
+            weekly_points if self.keep_points else None
+            )
+
+    def run_batch(self, batch_index, batch_size):
+        # outcomes is None or a dict of the per-sim arrays being kept
+        rankings, wins, losses, total_points, next_week, weekly_points = (
+            self.simulate(batch_index, batch_size)
+            )
+        outcomes = None
+        if self.keep_outcomes or self.keep_points:
+            outcomes = {'final_ranks': final_ranks(rankings)}
+        if self.keep_outcomes:
+            outcomes['next_week'] = next_week
+        if self.keep_points:
+            outcomes['weekly_points'] = weekly_points.astype(np.float32)
+
+        return rank_histogram(rankings), wins, losses, total_points, outcomes
+
+    def playoff_outcomes(self, batch_index, batch_size, playoff_spots=6):
+        # (sims x owners) flags for making the playoffs in each simulation
+        rankings = self.simulate(batch_index, batch_size)[0]
+        made_playoffs = np.zeros(rankings.shape, dtype=bool)
+        np.put_along_axis(
+            made_playoffs, rankings[:, :playoff_spots], True, axis = 1
+            )
+
+        return made_playoffs
+
+
+def compare_scenarios(simulator, scenario, batches):
+    # paired playoff odds difference (scenario minus simulator) per owner and
+    # its standard error, both in percentage points; with a shared seed every
+    # simulation uses the same random numbers in both scenarios
+    count = 0
+    total = 0.0
+    total_squares = 0.0
+    for batch in batches:
+        difference = (
+            scenario.playoff_outcomes(*batch).astype(float)
+            - simulator.playoff_outcomes(*batch)
+            )
+        count += len(difference)
+        total = total + difference.sum(axis = 0)
+        total_squares = total_squares + (difference ** 2).sum(axis = 0)
+
+    mean = total / count
+    variance = (total_squares / count - mean ** 2) * count / max(count - 1, 1)
+
+    return mean * 100, np.sqrt(variance / count) * 100
+
+
+def compare_backends(simulator, batches, backend='numba'):
+    # z scores of the differences between the numpy reference and another
+    # backend on the same league, per (owner, rank) probability and per
+    # owner for mean wins and points; the backends draw different numbers,
+    # so equivalent kernels give scores that look standard normal
+    summaries = []
+    for name in ('numpy', backend):
+        candidate = copy.copy(simulator)
+        candidate.backend = resolve_backend(name)
+        candidate.keep_outcomes = False
+        candidate.keep_points = False
+        count = 0
+        histogram = 0
+        sums = dict((field, 0.0) for field in ('wins', 'points'))
+        squares = dict(sums)
+        for batch in batches:
+            rankings, wins, losses, total_points = (
+                candidate.simulate(*batch)[:4]
+                )
+            count += len(rankings)
+            histogram = histogram + rank_histogram(rankings)
+            for field, values in (('wins', wins), ('points', total_points)):
+                sums[field] = sums[field] + values.sum(axis = 0)
+                squares[field] = squares[field] + (values ** 2.0).sum(axis = 0)
+        summary = {'ranks': (histogram / float(count), count)}
+        for field in sums:
+            mean = sums[field] / count
+            variance = squares[field] / count - mean ** 2
+            summary[field] = (mean, np.maximum(variance, 0.0) / count)
+        summaries.append(summary)
+
+    reference, candidate = summaries
+    (reference_odds, reference_count), (candidate_odds, candidate_count) = (
+        reference['ranks'], candidate['ranks']
+        )
+    pooled = (
+        (reference_odds * reference_count + candidate_odds * candidate_count)
+        / (reference_count + candidate_count)
+        )
+    rank_error = np.sqrt(
+        pooled * (1 - pooled) * (1.0 / reference_count + 1.0 / candidate_count)
+        )
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        scores = {
+            'ranks': np.where(
+                rank_error > 0,
+                (candidate_odds - reference_odds) / rank_error, 0.0
+                ),
+            }
+        for field in ('wins', 'points'):
+            error = np.sqrt(reference[field][1] + candidate[field][1])
+            scores[field] = np.where(
+                error > 0, (candidate[field][0] - reference[field][0]) / error,
+                0.0
+                )
+
+    return scores
+
+
+_worker_simulator = None
+
+
+def init_worker(simulator):
+    # process pool initializer, ships the league arrays once per worker
+    global _worker_simulator
+    _worker_simulator = simulator
+
+
+def run_worker_batch(batch):
+
+    return _worker_simulator.run_batch(*batch)
+
+
+def run_league_batch(task):
+    # (simulator, batch index, batch size) for pools shared between leagues
+    simulator, batch_index, batch_size = task
+
+    return simulator.run_batch(batch_index, batch_size)
+
+
+def windowed_imap(pool, function, tasks, window):
+    # pool.imap with at most window tasks queued at once, so a run that
+    # stops early leaves only those behind on a pool other leagues share
+    pending = collections.deque()
+    for task in tasks:
+        if len(pending) >= window:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(function, (task,)))
+    while pending:
+        yield pending.popleft().get()
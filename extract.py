@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+# page parsers for every scraped page type, built on precompiled XPath
+# so each table is walked once and no query string is parsed per row
+
+from io import BytesIO
+
+from lxml import etree, html
+
+
+def xpath(path):
+    # plain strings, a smart string would keep its whole tree alive
+    return etree.XPath(path, smart_strings = False)
+
+
+TEXT = xpath('./text()')
+HREF = xpath('./@href')
+CELL_TEXT = xpath('./td[$column]/text()')
+
+SCHEDULE_SCORES = xpath('//nobr/a/text()')
+SCHEDULE_OPPONENTS = xpath('//a[@target="_top"]/@title')
+
+ROSTER_ROWS = xpath('//tr[contains(@class, "pncPlayerRow")]')
+ROSTER_NAME = xpath('./td[2]/a/text()')
+ROSTER_POSITION = xpath('./td[2]/text()')
+
+STANDINGS_ROWS = xpath('//tr[@class="tableBody"]')
+STANDINGS_TITLE = xpath('./td/a[@title]/@title')
+STANDINGS_HREF = xpath('./td/a[@title]/@href')
+
+SEARCH_RESULTS = xpath('//span[@class="bodycontent"]')
+LINK_TEXT = xpath('./a/text()')
+LINK_HREF = xpath('./a/@href')
+DEFENSE_LINKS = xpath('//td[@class="sort1"]/a')
+
+TEAM_UPDATE = xpath('//td[@class = "update"]/text()')
+TEAM_ABBR = xpath(
+    '//span[contains(text(), "Season")]/following::table[1]'
+    '//tr[last()]/td[2]/text()'
+    )
+GAMELOGS = xpath('//span[contains(text(), "Gamelog")]/following::table[1]')
+GAMELOG_ROWS = xpath('.//tr')
+GAME_POINTS = xpath('./td[@class="sort1"]/text()')
+
+DEFENSE_TITLE = xpath('./td[1]/a/text()')
+DEFENSE_POINTS = xpath('./td[last()]/text()')
+
+GRID_TEAMS = xpath('//td[@align = "left" and @class = "tablehdr"]')
+GRID_TEAM = xpath('./strong/text()')
+GRID_WEEKS = xpath('./following-sibling::td')
+
+
+def parse(text):
+
+    return html.fromstring(text)
+
+
+def schedule(text):
+    # (scores, opponents) from an espn team schedule, played weeks give a
+    # score and unplayed ones a box score link beside the opponent title
+    tree = parse(text)
+    titles = SCHEDULE_OPPONENTS(tree)
+    scores = []
+    opponents = []
+
+    for index, score in enumerate(SCHEDULE_SCORES(tree)):
+        if not 'Box' in score:
+            scores.append(
+                float(score[score.find(' ') + 1:score.find('-')])
+                )
+        else:
+            opponents.append(titles[index])
+
+    return scores, opponents
+
+
+def roster(text):
+    # (name, position) for everyone on an espn clubhouse page but IR
+
+    players = []
+    for row in ROSTER_ROWS(parse(text)):
+        if CELL_TEXT(row, column = 1)[0] != 'IR':
+            try:
+                player_name = ROSTER_NAME(row)[0]
+                position_raw = ROSTER_POSITION(row)[0]
+            except IndexError:
+                continue
+            players.append((
+                player_name,
+                position_raw[position_raw.find(u'\xa0') + 1:].strip(u'\xa0')
+                ))
+
+    return players
+
+
+def standings(text):
+    # (name, team id, wins, losses) in standings order
+
+    entries = []
+    for row in STANDINGS_ROWS(parse(text)):
+        id_reference = STANDINGS_HREF(row)[0]
+        ID = id_reference[id_reference.find('teamId='):]
+        entries.append((
+            STANDINGS_TITLE(row)[0], ID[7:ID.find('&seasonId=')],
+            int(CELL_TEXT(row, column = 2)[0]),
+            int(CELL_TEXT(row, column = 3)[0])
+            ))
+
+    return entries
+
+
+def search_results(text):
+    # (result text, relative url) for an fftoday player search
+
+    return [
+        (LINK_TEXT(result)[0], LINK_HREF(result)[0])
+        for result in SEARCH_RESULTS(parse(text))
+        ]
+
+
+def defense_links(text):
+    # (team name, relative url) for every defense on the season table
+
+    return [
+        (TEXT(link)[0], HREF(link)[0])
+        for link in DEFENSE_LINKS(parse(text))
+        ]
+
+
+def has_team_info(tree):
+
+    return bool(TEAM_UPDATE(tree))
+
+
+def team_info(tree):
+    # (full team, abbreviation) from an fftoday player page
+
+    raw_team = TEAM_UPDATE(tree)[0]
+
+    return raw_team[raw_team.find(',') + 2:], TEAM_ABBR(tree)[0]
+
+
+def gamelog_scores(gamelog):
+    # fantasy points per game in one season's log, newest first
+
+    season = []
+    for row in GAMELOG_ROWS(gamelog):
+        points = GAME_POINTS(row)
+        try:
+            int(points[0])
+            season.append(float(points[-1]))
+        except (IndexError, ValueError):
+            continue
+
+    return season[::-1]
+
+
+def game_scores(tree):
+    # every season on the page, newest season first
+
+    scores = []
+    for gamelog in GAMELOGS(tree):
+        scores.extend(gamelog_scores(gamelog))
+
+    return scores
+
+
+def season_scores(tree):
+    # only the current season, the first log on the page
+    gamelogs = GAMELOGS(tree)
+
+    return gamelog_scores(gamelogs[0]) if gamelogs else []
+
+
+def defense_rows(text):
+    # (row title, points) after the column header of an fftoday fantasy
+    # stats table; these are the big pages, so rows are streamed and
+    # dropped as soon as they are read instead of kept in a full tree
+    rows = []
+    header_parents = set()
+
+    for _, row in etree.iterparse(
+            BytesIO(text.encode('utf-8')), events = ('end',), tag = 'tr',
+            html = True, encoding = 'utf-8'
+            ):
+        parent = row.getparent()
+        if row.get('class') == 'tableclmhdr':
+            header_parents.add(parent)
+        elif parent in header_parents:
+            rows.append((
+                DEFENSE_TITLE(row)[0], float(DEFENSE_POINTS(row)[0])
+                ))
+            row.clear()
+
+    return rows
+
+
+def schedule_grid(text):
+    # {team abbreviation: [opponent or None per week]}, byes have no text
+
+    grid = {}
+    for team in GRID_TEAMS(parse(text)):
+        abbr = GRID_TEAM(team)[0]
+        if abbr == 'Bye':
+            continue
+        weeks = []
+        for matchup in GRID_WEEKS(team):
+            opponent = TEXT(matchup)
+            weeks.append(opponent[0].strip('@') if opponent else None)
+        grid[abbr] = weeks
+
+    return grid
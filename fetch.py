@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# pooled, concurrent http fetching for the scraping phase
+
+import threading
+import time
+import urlparse
+from multiprocessing.pool import ThreadPool
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+
+class HostLimiter(object):
+    # spaces out requests to a single host so it sees at most `rate` per second
+
+    def __init__(self, rate):
+
+        self.interval = 1.0 / rate
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+
+        with self.lock:
+            now = time.time()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+        return
+
+
+class Flight(object):
+    # a request in progress that other threads asking for the same url wait on
+
+    def __init__(self):
+
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class Fetcher(object):
+    # one connection pool and a bounded number of requests in flight
+
+    def __init__(
+            self, max_workers=16, host_rate=8.0, retries=3, backoff=0.5,
+            timeout=30, cache=None, metrics=None
+            ):
+
+        self.cache = cache
+        self.metrics = metrics
+        self.max_workers = max_workers
+        self.host_rate = host_rate
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(
+            total = retries, backoff_factor = backoff,
+            status_forcelist = (429, 500, 502, 503, 504)
+            )
+        adapter = HTTPAdapter(
+            pool_connections = 4, pool_maxsize = max_workers,
+            max_retries = retry
+            )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.limiters = {}
+        self.limiter_lock = threading.Lock()
+        self.in_flight = {}
+        self.flight_lock = threading.Lock()
+        self.pool = ThreadPool(max_workers)
+
+    def limiter(self, url):
+
+        host = urlparse.urlparse(url).netloc
+        with self.limiter_lock:
+            if host not in self.limiters:
+                self.limiters[host] = HostLimiter(self.host_rate)
+
+        return self.limiters[host]
+
+    def get(self, url, refresh=False):
+        # refresh skips a cached copy but still caches the new response,
+        # except offline, where the cache is all there is
+        if self.cache is not None and (not refresh or self.cache.offline):
+            cached = self.cache.get(url)
+            if cached is not None:
+                self.count('http_cache_hits')
+                return cached
+
+        # concurrent requests for one url, say from two leagues, share a fetch
+        with self.flight_lock:
+            flight = self.in_flight.get(url)
+            leader = flight is None
+            if leader:
+                flight = self.in_flight[url] = Flight()
+        if not leader:
+            self.count('http_coalesced')
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.response
+
+        try:
+            self.limiter(url).wait()
+            start = time.time()
+            flight.response = self.session.get(url, timeout = self.timeout)
+            if self.metrics is not None:
+                self.metrics.record_request(
+                    time.time() - start, len(flight.response.content)
+                    )
+            if self.cache is not None:
+                self.cache.store(url, flight.response)
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self.flight_lock:
+                del self.in_flight[url]
+            flight.done.set()
+
+        return flight.response
+
+    def count(self, name):
+
+        if self.metrics is not None:
+            self.metrics.count(name)
+
+        return
+
+    def get_many(self, urls):
+
+        return self.map(self.get, urls)
+
+    def map(self, func, items):
+        # run func over items on the fetch threads, results keep input order
+        return self.pool.map(func, items, chunksize = 1)
+
+    def close(self):
+
+        self.pool.close()
+        self.pool.join()
+        self.session.close()
+
+        return
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# playoff odds under changed lineups, answered by reweighting the stored
+# simulations instead of simulating again
+
+import math
+
+import numpy as np
+
+
+normal_cdf = np.vectorize(lambda x: 0.5 * math.erfc(-x / math.sqrt(2)))
+
+
+def censored_moments(scores, deviations):
+    # mean and variance of each week's points for (weeks x slots) lineups,
+    # every slot a normal with negative draws counting as zero, as in
+    # engine.draw_point_totals
+    scores = np.asarray(scores, dtype=np.float64)
+    deviations = np.asarray(deviations, dtype=np.float64)
+    drawn = deviations > 0
+    spread = np.where(drawn, deviations, 1.0)
+    z = scores / spread
+    below = normal_cdf(z)
+    density = np.exp(-0.5 * z * z) / math.sqrt(2 * math.pi)
+    mean = np.where(
+        drawn, scores * below + spread * density, np.maximum(scores, 0.0)
+        )
+    square = np.where(
+        drawn,
+        (scores ** 2 + spread ** 2) * below + scores * spread * density,
+        np.maximum(scores, 0.0) ** 2
+        )
+    variance = np.maximum(square - mean ** 2, 0.0)
+
+    return mean.sum(axis = 1), variance.sum(axis = 1)
+
+
+class ImpactStore(object):
+    # every sim's (owners x weeks) points and playoff finish; a changed
+    # lineup for one owner becomes a weight per sim, the ratio of normal
+    # densities of that owner's weekly points under the new and the
+    # simulated lineup, so whole tables of changes come from one run
+
+    def __init__(self, owner_names, capacity, weeks, playoff_spots=6):
+
+        self.owner_names = list(owner_names)
+        self.playoff_spots = playoff_spots
+        self.count = 0
+        self.weekly_points = np.zeros(
+            (capacity, len(self.owner_names), weeks), dtype=np.float32
+            )
+        self.made_playoffs = np.zeros(
+            (capacity, len(self.owner_names)), dtype=bool
+            )
+
+    def add(self, final_ranks, weekly_points):
+
+        size = len(final_ranks)
+        self.weekly_points[self.count:self.count + size] = weekly_points
+        self.made_playoffs[self.count:self.count + size] = (
+            final_ranks < self.playoff_spots
+            )
+        self.count += size
+
+        return
+
+    def playoff_odds(self, owner):
+
+        return self.made_playoffs[:self.count, owner].mean() * 100
+
+    def reweighted_odds(self, owner, base, changes):
+        # base and each change are (means, variances) of the owner's weekly
+        # points, from censored_moments; returns playoff odds in percent
+        # and the effective number of sims behind each, one per change
+        base_means, base_variances = base
+        means = np.array([change[0] for change in changes]).T
+        variances = np.array([change[1] for change in changes]).T
+        # weeks nobody plays on either lineup carry no information
+        active = (base_variances > 0) & (variances > 0).all(axis = 1)
+        base_means = base_means[active, np.newaxis]
+        base_variances = base_variances[active, np.newaxis]
+        means = means[active]
+        variances = variances[active]
+
+        # the log density ratio is quadratic in each week's points, so all
+        # changes are weighed in two matrix products
+        points = self.weekly_points[:self.count, owner][:, active].astype(
+            np.float64
+            )
+        quadratic = 0.5 / base_variances - 0.5 / variances
+        linear = means / variances - base_means / base_variances
+        constant = (
+            0.5 * np.log(base_variances / variances)
+            + 0.5 * base_means ** 2 / base_variances
+            - 0.5 * means ** 2 / variances
+            ).sum(axis = 0)
+        log_weights = (
+            (points ** 2).dot(quadratic) + points.dot(linear) + constant
+            )
+        log_weights -= log_weights.max(axis = 0)
+        weights = np.exp(log_weights)
+        totals = weights.sum(axis = 0)
+        made_playoffs = self.made_playoffs[:self.count, owner]
+
+        return (
+            made_playoffs.dot(weights) * 100 / totals,
+            totals ** 2 / (weights ** 2).sum(axis = 0)
+            )
+
+    def state(self):
+
+        return {
+            'count': np.array(self.count),
+            'weekly_points': self.weekly_points[:self.count],
+            'made_playoffs': self.made_playoffs[:self.count],
+            }
+
+    def load_state(self, state):
+
+        self.count = int(state['count'])
+        self.weekly_points[:self.count] = state['weekly_points']
+        self.made_playoffs[:self.count] = state['made_playoffs']
+
+        return
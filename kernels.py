@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+# fused season kernel for the numba backend: each simulation is drawn,
+# summed, played and ranked in one pass, so no (sims x owners x weeks x
+# slots) block of draws is ever built; draws come from a splitmix64 stream
+# per simulation through a ziggurat, numba's own np.random normals being
+# slower than numpy's, so a seed gives different sims than the numpy backend
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def finish_season(
+        points, sim, opponents, wins, losses, total_points, season_games,
+        division_spots, rankings, final_wins, final_losses, final_points,
+        next_week, weekly_points
+        ):
+    # plays one simulated (owners x weeks) block of points into row sim of
+    # the outputs, ranking like engine.rank_owners and engine.wild_card
+    owners, weeks = points.shape
+    if weekly_points.shape[0]:
+        weekly_points[sim] = points
+    for owner in range(owners):
+        won = wins[owner]
+        lost = losses[owner]
+        total = total_points[owner]
+        for week in range(weeks):
+            total += points[owner, week]
+            opponent = opponents[owner, week]
+            if opponent >= 0:
+                if points[owner, week] > points[opponent, week]:
+                    won += 1
+                elif points[owner, week] < points[opponent, week]:
+                    lost += 1
+        final_wins[sim, owner] = won
+        final_losses[sim, owner] = lost
+        final_points[sim, owner] = total
+        opponent = opponents[owner, 0]
+        next_week[sim, owner] = (
+            opponent >= 0 and points[owner, 0] > points[opponent, 0]
+            )
+
+    # insertion sort, best first, ties keep the lower owner index first
+    for owner in range(owners):
+        percentage = final_wins[sim, owner] / season_games[owner]
+        position = owner
+        while position > 0:
+            other = rankings[sim, position - 1]
+            other_percentage = final_wins[sim, other] / season_games[other]
+            if percentage < other_percentage or (
+                    percentage == other_percentage
+                    and final_points[sim, owner] <= final_points[sim, other]
+                    ):
+                break
+            rankings[sim, position] = other
+            position -= 1
+        rankings[sim, position] = owner
+
+    if division_spots < owners:
+        leader = division_spots
+        for position in range(division_spots + 1, owners):
+            if (
+                    final_points[sim, rankings[sim, position]]
+                    > final_points[sim, rankings[sim, leader]]
+                    ):
+                leader = position
+        moved = rankings[sim, leader]
+        for position in range(leader, division_spots, -1):
+            rankings[sim, position] = rankings[sim, position - 1]
+        rankings[sim, division_spots] = moved
+
+    return
+
+
+def ziggurat_tables(
+        layers=128, tail=3.442619855899, area=9.91256303526217e-3
+        ):
+    # layer edges and edge ratios of the ziggurat for the standard normal,
+    # Marsaglia and Tsang's method with Doornik's 128 layer constants
+    edges = np.zeros(layers + 1)
+    edges[0] = area / np.exp(-0.5 * tail * tail)
+    edges[1] = tail
+    for layer in range(2, layers):
+        edges[layer] = np.sqrt(-2 * np.log(
+            area / edges[layer - 1] + np.exp(-0.5 * edges[layer - 1] ** 2)
+            ))
+    ratios = edges[1:] / edges[:-1]
+
+    return edges, ratios
+
+
+EDGES, RATIOS = ziggurat_tables()
+TAIL = EDGES[1]
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX_2 = np.uint64(0x94D049BB133111EB)
+SHIFT_11 = np.uint64(11)
+SHIFT_27 = np.uint64(27)
+SHIFT_30 = np.uint64(30)
+SHIFT_31 = np.uint64(31)
+SHIFT_32 = np.uint64(32)
+LAYER_MASK = np.uint64(127)
+UNIT = 1.0 / 2 ** 53
+
+
+def next_bits(state):
+    # splitmix64, state is a one element uint64 array
+    state[0] += GOLDEN
+    bits = state[0]
+    bits = (bits ^ (bits >> SHIFT_30)) * MIX_1
+    bits = (bits ^ (bits >> SHIFT_27)) * MIX_2
+
+    return bits ^ (bits >> SHIFT_31)
+
+
+def next_uniform(state):
+    # in (0, 1), so its log is finite
+    return ((next_bits(state) >> SHIFT_11) + 0.5) * UNIT
+
+
+def split_bits(bits):
+    # a ziggurat layer from the low bits and a uniform in (-1, 1) from the
+    # high 53
+    layer = np.int64(bits & LAYER_MASK)
+
+    return layer, 2.0 * ((bits >> SHIFT_11) + 0.5) * UNIT - 1.0
+
+
+def edge_normal(state, layer, uniform, edges, ratios):
+    # finishes a normal draw whose uniform fell outside its layer's inner
+    # rectangle, about 3% of them; the common case is written out in
+    # simulate_seasons, since calls that pass arrays are not free
+    while True:
+        if layer == 0:
+            # the tail beyond the base layer
+            while True:
+                x = np.log(next_uniform(state)) / TAIL
+                y = np.log(next_uniform(state))
+                if -2.0 * y >= x * x:
+                    break
+            return x - TAIL if uniform < 0 else TAIL - x
+        x = uniform * edges[layer]
+        inner = np.exp(-0.5 * (edges[layer] ** 2 - x * x))
+        outer = np.exp(-0.5 * (edges[layer + 1] ** 2 - x * x))
+        if outer + next_uniform(state) * (inner - outer) < 1.0:
+            return x
+        layer, uniform = split_bits(next_bits(state))
+        if abs(uniform) < ratios[layer]:
+            return uniform * edges[layer]
+
+
+def simulate_seasons(
+        lineup_scores, lineup_deviations, opponents, wins, losses,
+        total_points, season_games, seed, antithetic, division_spots,
+        rankings, final_wins, final_losses, final_points, next_week,
+        weekly_points, edges, ratios
+        ):
+    # fills the (sims x owners) outputs; every simulation draws from its own
+    # splitmix64 stream keyed by (seed, sim), so results do not depend on
+    # how sims are split up; antithetic pairs sim i with sim i + half on
+    # the negated draws, the same pairing engine.standard_draws uses
+    sims, owners = rankings.shape
+    weeks, slots = lineup_scores.shape[1], lineup_scores.shape[2]
+    half = (sims + 1) // 2 if antithetic else sims
+    points = np.empty((2, owners, weeks))
+    state = np.zeros(1, dtype=np.uint64)
+    for pair in range(half):
+        state[0] = (np.uint64(seed) << SHIFT_32) | np.uint64(pair)
+        state[0] = next_bits(state)
+        for owner in range(owners):
+            for week in range(weeks):
+                plus = 0.0
+                minus = 0.0
+                for slot in range(slots):
+                    layer, uniform = split_bits(next_bits(state))
+                    if abs(uniform) < ratios[layer]:
+                        draw = uniform * edges[layer]
+                    else:
+                        draw = edge_normal(
+                            state, layer, uniform, edges, ratios
+                            )
+                    mean = lineup_scores[owner, week, slot]
+                    spread = lineup_deviations[owner, week, slot] * draw
+                    plus += max(mean + spread, 0.0)
+                    minus += max(mean - spread, 0.0)
+                points[0, owner, week] = plus
+                points[1, owner, week] = minus
+        finish_season(
+            points[0], pair, opponents, wins, losses, total_points,
+            season_games, division_spots, rankings, final_wins,
+            final_losses, final_points, next_week, weekly_points
+            )
+        if antithetic and pair + half < sims:
+            finish_season(
+                points[1], pair + half, opponents, wins, losses,
+                total_points, season_games, division_spots, rankings,
+                final_wins, final_losses, final_points, next_week,
+                weekly_points
+                )
+
+    return
+
+
+if numba is not None:
+    # cache writes the compiled kernels next to this module, so only the
+    # first run after an install or an edit pays for compiling them
+    jit = numba.njit(cache = True, nogil = True)
+    finish_season = jit(finish_season)
+    next_bits = jit(next_bits)
+    next_uniform = jit(next_uniform)
+    split_bits = jit(split_bits)
+    edge_normal = jit(edge_normal)
+    simulate_seasons = jit(simulate_seasons)
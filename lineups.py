@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# batched lineup setting for every owner and week at once
+
+import numpy as np
+
+
+SLOTS = ['QB', 'RB', 'RB', 'WR', 'WR', 'TE', 'FLEX', 'K', 'D/ST']
+FLEX_POSITIONS = ['RB', 'WR', 'TE']
+
+
+def flex_replacement(replacement_scores):
+    # an empty flex takes the best replacement level among flex positions
+    return max(
+        FLEX_POSITIONS, key = lambda position: replacement_scores[position]
+        )
+
+
+def roster_matrix(rosters):
+    # (owners x roster spots) projection rows, -1 pads short rosters
+    size = max(len(roster) for roster in rosters)
+    matrix = np.full((len(rosters), size), -1, dtype=int)
+    for row, roster in enumerate(rosters):
+        matrix[row, :len(roster)] = roster
+
+    return matrix
+
+
+def fill_slots(
+        candidates, deviations, selected, slot_scores, slot_deviations,
+        slot_players, slots, replacement_score, replacement_deviation
+        ):
+    # best len(slots) candidates per owner and week, ties keep roster order;
+    # slot_players gets their roster spots, -1 for replacement level
+    order = np.argsort(-candidates, axis = 1, kind = 'mergesort')
+    order = order[:, :len(slots)]
+    best = np.take_along_axis(candidates, order, axis = 1)
+    filled = np.isfinite(best)
+    best_deviations = np.take_along_axis(deviations, order, axis = 1)
+    np.put_along_axis(
+        selected, order,
+        filled | np.take_along_axis(selected, order, axis = 1), axis = 1
+        )
+
+    slot_scores[:, :, slots] = np.where(
+        filled, best, replacement_score
+        ).transpose(0, 2, 1)
+    slot_deviations[:, :, slots] = np.where(
+        filled, best_deviations, replacement_deviation
+        ).transpose(0, 2, 1)
+    slot_players[:, :, slots] = np.where(filled, order, -1).transpose(0, 2, 1)
+
+    return
+
+
+def optimal_lineups(
+        projections, stdevs, positions, rosters, replacement_scores,
+        replacement_deviations
+        ):
+    # projections is players x weeks, stdevs and positions are per player,
+    # rosters lists each owner's projection rows; returns dense
+    # (owners x weeks x slots) score and deviation arrays and the roster
+    # spot starting in each slot, -1 where replacement level fills it
+    roster_rows = roster_matrix(rosters)
+    on_roster = roster_rows >= 0
+    roster_rows = np.maximum(roster_rows, 0)
+    weeks = projections.shape[1]
+
+    roster_scores = np.where(
+        on_roster[:, :, np.newaxis], projections[roster_rows], -np.inf
+        )
+    roster_deviations = np.repeat(
+        np.asarray(stdevs, dtype=np.float32)[roster_rows][:, :, np.newaxis],
+        weeks, axis = 2
+        )
+    roster_positions = np.where(
+        on_roster, np.asarray(positions, dtype=object)[roster_rows], ''
+        )[:, :, np.newaxis]
+
+    shape = (len(rosters), weeks, len(SLOTS))
+    slot_scores = np.zeros(shape, dtype=np.float32)
+    slot_deviations = np.zeros(shape, dtype=np.float32)
+    slot_players = np.full(shape, -1, dtype=int)
+    selected = np.zeros(roster_scores.shape, dtype=bool)
+
+    for position in ['QB', 'RB', 'WR', 'TE', 'K', 'D/ST']:
+        fill_slots(
+            np.where(roster_positions == position, roster_scores, -np.inf),
+            roster_deviations, selected, slot_scores, slot_deviations,
+            slot_players,
+            [index for index, slot in enumerate(SLOTS) if slot == position],
+            replacement_scores[position], replacement_deviations[position]
+            )
+
+    flex_position = flex_replacement(replacement_scores)
+    flex_eligible = np.zeros(roster_positions.shape, dtype=bool)
+    for position in FLEX_POSITIONS:
+        flex_eligible |= roster_positions == position
+    fill_slots(
+        np.where(flex_eligible & ~selected, roster_scores, -np.inf),
+        roster_deviations, selected, slot_scores, slot_deviations,
+        slot_players, [SLOTS.index('FLEX')], replacement_scores[flex_position],
+        replacement_deviations[flex_position]
+        )
+
+    return slot_scores, slot_deviations, slot_players
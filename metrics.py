@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+# run metrics with pluggable sinks, nothing here runs per draw
+
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+
+
+def reset_peak_memory():
+    # linux can reset the resident high-water mark, so the next reading
+    # covers only what ran since; elsewhere the peak stays process wide
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except (IOError, OSError):
+        return False
+
+    return True
+
+
+def peak_memory_mb():
+    # this process only, simulation workers are not counted
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+    except (IOError, OSError):
+        pass
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class Sink(object):
+    # the quiet sink, also the base for the others
+
+    def progress(self, snapshot):
+
+        return
+
+    def close(self, snapshot):
+
+        return
+
+
+class ProgressSink(Sink):
+    # one progress line, rewritten at most every `interval` seconds
+
+    def __init__(self, stream=None, interval=1.0):
+
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self.last_write = 0.0
+
+    def progress(self, snapshot):
+
+        now = time.time()
+        if now - self.last_write < self.interval:
+            return
+        self.last_write = now
+        self.stream.write('\r%s' % self.format(snapshot))
+        self.stream.flush()
+
+        return
+
+    def format(self, snapshot):
+
+        simulation = snapshot['simulation']
+        return '%d/%d sims  %.0f sims/sec  eta %.0fs  %d requests' % (
+            simulation['completed'], simulation['total'],
+            simulation['sims_per_second'], simulation['eta'],
+            snapshot['counters'].get('http_requests', 0)
+            )
+
+    def close(self, snapshot):
+        # values like the seed are printed so a run can be repeated
+        self.stream.write('\r%s\n' % self.format(snapshot))
+        for stage, seconds in sorted(snapshot['stage_times'].items()):
+            if stage in snapshot['stage_memory']:
+                self.stream.write('%-28s %9.3f s %9.1f MB\n' % (
+                    stage, seconds, snapshot['stage_memory'][stage]
+                    ))
+            else:
+                self.stream.write('%-28s %9.3f s\n' % (stage, seconds))
+        for name, value in sorted(snapshot['values'].items()):
+            self.stream.write('%-28s %s\n' % (name, value))
+        self.stream.flush()
+
+        return
+
+
+class JSONSink(Sink):
+    # the full snapshot as a json file, refreshed at most every `interval`
+
+    def __init__(self, path, interval=10.0):
+
+        self.path = path
+        self.interval = interval
+        self.last_write = 0.0
+
+    def write(self, snapshot):
+
+        with open(self.path + '.tmp', 'w') as metrics_file:
+            json.dump(snapshot, metrics_file, indent = 1, sort_keys = True)
+        os.rename(self.path + '.tmp', self.path)
+
+        return
+
+    def progress(self, snapshot):
+
+        now = time.time()
+        if now - self.last_write >= self.interval:
+            self.last_write = now
+            self.write(snapshot)
+
+        return
+
+    def close(self, snapshot):
+
+        self.write(snapshot)
+
+        return
+
+
+class Metrics(object):
+
+    def __init__(self, sinks=None):
+
+        self.sinks = [ProgressSink()] if sinks is None else sinks
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.values = {}
+        self.stage_times = {}
+        self.stage_memory = {}
+        self.max_latency = 0.0
+        self.sim_total = 0
+        self.sim_completed = 0
+        self.sim_start = None
+
+    def count(self, name, amount=1):
+
+        with self.lock:
+            self.counters[name] += amount
+
+        return
+
+    def set(self, name, value):
+
+        with self.lock:
+            self.values[name] = value
+
+        return
+
+    def record_request(self, seconds, size):
+
+        with self.lock:
+            self.counters['http_requests'] += 1
+            self.counters['http_bytes'] += size
+            self.counters['http_seconds'] += seconds
+            self.max_latency = max(self.max_latency, seconds)
+
+        return
+
+    def record_stage(self, name, seconds, peak_memory=None):
+        # peak_memory is the stage's peak resident size in megabytes
+        with self.lock:
+            self.stage_times[name] = seconds
+            if peak_memory is not None:
+                self.stage_memory[name] = peak_memory
+
+        return
+
+    def start_progress(self, total):
+
+        self.sim_total = total
+        self.sim_completed = 0
+        self.sim_start = time.time()
+
+        return
+
+    def progress(self, completed):
+        # called once per merged batch
+        self.sim_completed = completed
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            sink.progress(snapshot)
+
+        return
+
+    def snapshot(self):
+
+        with self.lock:
+            elapsed = time.time() - self.sim_start if self.sim_start else 0.0
+            rate = self.sim_completed / elapsed if elapsed > 0 else 0.0
+            requests = self.counters.get('http_requests', 0)
+
+            return {
+                'counters': dict(self.counters),
+                'values': dict(self.values),
+                'stage_times': dict(self.stage_times),
+                'stage_memory': dict(self.stage_memory),
+                'http': {
+                    'mean_latency': (
+                        self.counters.get('http_seconds', 0.0) / requests
+                        if requests else 0.0
+                        ),
+                    'max_latency': self.max_latency,
+                    },
+                'simulation': {
+                    'completed': self.sim_completed,
+                    'total': self.sim_total,
+                    'elapsed': elapsed,
+                    'sims_per_second': rate,
+                    'eta': (
+                        (self.sim_total - self.sim_completed) / rate
+                        if rate > 0 else 0.0
+                        ),
+                    },
+                }
+
+    def close(self):
+
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            sink.close(snapshot)
+
+        return
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# result writers for the rank and power rankings tables, one per format
+
+import os
+
+import pandas as pd
+
+
+class TableWriter(object):
+    # writes each table to a temporary file then renames it over the old
+    # one, so a dashboard polling the directory never reads half a table
+
+    extension = None
+
+    def __init__(self, directory):
+
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, name):
+
+        return os.path.join(self.directory, name + self.extension)
+
+    def write(self, name, table):
+
+        path = self.path(name)
+        temp_path = os.path.join(
+            self.directory, '.' + name + '.tmp' + self.extension
+            )
+        self.write_table(table, temp_path)
+        os.rename(temp_path, path)
+
+        return path
+
+    def write_table(self, table, path):
+
+        raise NotImplementedError
+
+
+class ExcelWriter(TableWriter):
+
+    extension = '.xlsx'
+
+    def write_table(self, table, path):
+
+        writer = pd.ExcelWriter(path)
+        table.to_excel(writer)
+        writer.save()
+
+        return
+
+
+class CSVWriter(TableWriter):
+
+    extension = '.csv'
+
+    def write_table(self, table, path):
+
+        table.to_csv(path, encoding = 'utf-8')
+
+        return
+
+
+class JSONWriter(TableWriter):
+    # one record per team, the index becomes a column
+
+    extension = '.json'
+
+    def write_table(self, table, path):
+
+        table.reset_index().to_json(path, orient = 'records')
+
+        return
+
+
+class ParquetWriter(TableWriter):
+
+    extension = '.parquet'
+
+    def __init__(self, directory):
+        # fail before a run rather than after it
+        if not hasattr(pd.DataFrame, 'to_parquet'):
+            raise ImportError(
+                'parquet output needs pandas >= 0.21 with pyarrow or '
+                'fastparquet'
+                )
+        super(ParquetWriter, self).__init__(directory)
+
+    def write_table(self, table, path):
+
+        # parquet column names have to be strings, rank columns are ints
+        table = table.reset_index()
+        table.columns = [str(column) for column in table.columns]
+        table.to_parquet(path)
+
+        return
+
+
+WRITERS = {
+    'excel': ExcelWriter,
+    'csv': CSVWriter,
+    'json': JSONWriter,
+    'parquet': ParquetWriter,
+    }
+
+
+def make_writer(output_format, directory):
+
+    if output_format not in WRITERS:
+        raise ValueError('unknown output format %s' % output_format)
+
+    return WRITERS[output_format](directory)
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+# named, memoized stages for building and running a Simulation
+
+import cPickle as pickle
+import hashlib
+import os
+import time
+
+from metrics import peak_memory_mb, reset_peak_memory
+
+
+class Stage(object):
+    # params are the target attributes the stage's result depends on,
+    # outputs are the attributes it creates or changes; transient outputs,
+    # like per-sim stores, are too big to pickle and are memoized only by
+    # reference in memory, so neither this stage nor any after it is
+    # written to disk
+
+    def __init__(
+            self, name, method, params=(), outputs=(), memoize=True,
+            transient=()
+            ):
+
+        self.name = name
+        self.method = method
+        self.params = params
+        self.outputs = outputs
+        self.memoize = memoize
+        self.transient = transient
+
+
+class Pipeline(object):
+    # artifacts embed scraped pages, so on disk they expire after max_age
+    # seconds, and in memory only the newest of each stage is kept
+
+    def __init__(
+            self, target, stages, cache_dir=None, metrics=None, max_age=None,
+            measure_memory=False
+            ):
+
+        self.target = target
+        self.metrics = metrics
+        self.stages = stages
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        # stage index: (fingerprint, pickled state, transient outputs)
+        self.artifacts = {}
+        self.timings = {}
+        # peak resident megabytes of each stage's last execution; the
+        # high-water mark is process wide, so only measure a pipeline that
+        # runs alone, never one of several leagues sharing a process
+        self.measure_memory = measure_memory
+        self.memory = {}
+        if cache_dir is not None and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def fingerprints(self):
+        # each stage hashes its own params on top of everything upstream
+        fingerprints = []
+        previous = ''
+        for stage in self.stages:
+            digest = hashlib.sha1(previous + stage.name)
+            for param in stage.params:
+                digest.update(
+                    '|%s=%r' % (param, getattr(self.target, param, None))
+                    )
+            previous = digest.hexdigest()
+            fingerprints.append(previous)
+
+        return fingerprints
+
+    def fingerprint(self, name):
+
+        return self.fingerprints()[self.index(name)]
+
+    def index(self, name):
+
+        for index, stage in enumerate(self.stages):
+            if stage.name == name:
+                return index
+
+        raise KeyError('no pipeline stage named %s' % name)
+
+    def artifact_path(self, index, fingerprint):
+
+        return os.path.join(
+            self.cache_dir, self.stages[index].name + '-' + fingerprint + '.pkl'
+            )
+
+    def memory_artifact(self, index, fingerprint):
+
+        artifact = self.artifacts.get(index)
+
+        return artifact if artifact and artifact[0] == fingerprint else None
+
+    def expired(self, path):
+
+        return (
+            self.max_age is not None
+            and time.time() - os.path.getmtime(path) > self.max_age
+            )
+
+    def transient(self, index):
+
+        names = set()
+        for stage in self.stages[:index + 1]:
+            names.update(stage.transient)
+
+        return names
+
+    def has_artifact(self, index, fingerprint):
+
+        if self.memory_artifact(index, fingerprint) is not None:
+            return True
+        if self.cache_dir is None or self.transient(index):
+            return False
+        path = self.artifact_path(index, fingerprint)
+
+        return os.path.exists(path) and not self.expired(path)
+
+    def prune(self):
+        # drop expired artifacts left on disk by this or earlier runs
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if name.endswith('.pkl') and self.expired(path):
+                    os.remove(path)
+            except OSError:
+                continue
+
+        return
+
+    def store(self, index, fingerprint):
+        # everything produced up to this stage is pickled together so objects
+        # shared between outputs, like players on rosters, stay shared
+        outputs = set()
+        for stage in self.stages[:index + 1]:
+            outputs.update(stage.outputs)
+        state = pickle.dumps(
+            dict(
+                (name, getattr(self.target, name))
+                for name in outputs if hasattr(self.target, name)
+                ),
+            pickle.HIGHEST_PROTOCOL
+            )
+        transient = dict(
+            (name, getattr(self.target, name))
+            for name in self.transient(index) if hasattr(self.target, name)
+            )
+
+        self.artifacts[index] = (fingerprint, state, transient)
+        if self.cache_dir is not None and not transient:
+            path = self.artifact_path(index, fingerprint)
+            with open(path + '.tmp', 'wb') as artifact_file:
+                artifact_file.write(state)
+            os.rename(path + '.tmp', path)
+            self.prune()
+
+        return
+
+    def restore(self, index, fingerprint):
+
+        artifact = self.memory_artifact(index, fingerprint)
+        if artifact is None:
+            with open(self.artifact_path(index, fingerprint), 'rb') as artifact_file:
+                artifact = (fingerprint, artifact_file.read(), {})
+        fingerprint, state, transient = artifact
+        for name, value in pickle.loads(state).iteritems():
+            setattr(self.target, name, value)
+        for name, value in transient.iteritems():
+            setattr(self.target, name, value)
+
+        return
+
+    def execute(self, index, fingerprint):
+
+        stage = self.stages[index]
+        if self.measure_memory:
+            reset_peak_memory()
+        start = time.time()
+        getattr(self.target, stage.method)()
+        self.timings[stage.name] = time.time() - start
+        if self.measure_memory:
+            self.memory[stage.name] = peak_memory_mb()
+        if self.metrics is not None:
+            self.metrics.record_stage(
+                stage.name, self.timings[stage.name],
+                self.memory.get(stage.name)
+                )
+        if stage.memoize:
+            self.store(index, fingerprint)
+
+        return
+
+    def adopt(self, name):
+        # take the target's current state, updated in place, as the result
+        # of the named stage so the next run only redoes what follows it
+        index = self.index(name)
+        self.store(index, self.fingerprints()[index])
+
+        return
+
+    def resume_point(self, fingerprints, stop):
+        # restore the newest memoized stage before stop, return where to go on
+        for index in range(stop - 1, -1, -1):
+            stage = self.stages[index]
+            if stage.memoize and self.has_artifact(index, fingerprints[index]):
+                self.restore(index, fingerprints[index])
+                return index + 1
+
+        return 0
+
+    def run(self, until=None):
+
+        stop = len(self.stages) if until is None else self.index(until) + 1
+        fingerprints = self.fingerprints()
+        for index in range(self.resume_point(fingerprints, stop), stop):
+            self.execute(index, fingerprints[index])
+
+        return
+
+    def run_stage(self, name):
+        # run one stage on its own from memoized upstream state, for profiling
+        index = self.index(name)
+        fingerprints = self.fingerprints()
+        for upstream in range(self.resume_point(fingerprints, index), index):
+            self.execute(upstream, fingerprints[upstream])
+        self.execute(index, fingerprints[index])
+
+        return self.timings[name]
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# persistent map from espn player name and position to fftoday player page
+
+import json
+import os
+import threading
+import time
+
+
+class PlayerIndex(object):
+    # one index file can be shared by every league, urls carry no league id
+
+    def __init__(self, path=None):
+
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.changed = False
+        if path is not None and os.path.exists(path):
+            with open(path) as index_file:
+                self.entries = json.load(index_file)
+
+    def key(self, player):
+
+        return player.player_name + '|' + player.position
+
+    def lookup(self, player):
+
+        with self.lock:
+            return self.entries.get(self.key(player))
+
+    def record(self, player, url):
+        # remember where a player was resolved, and the team seen there
+        key = self.key(player)
+        with self.lock:
+            entry = self.entries.get(key)
+            if (
+                    entry is None or entry['url'] != url
+                    or entry['team'] != player.full_team
+                    ):
+                self.entries[key] = {
+                    'url': url, 'team': player.full_team,
+                    'updated': time.time()
+                    }
+                self.changed = True
+
+        return
+
+    def forget(self, player):
+
+        with self.lock:
+            if self.entries.pop(self.key(player), None) is not None:
+                self.changed = True
+
+        return
+
+    def save(self):
+
+        if self.path is None or not self.changed:
+            return
+        with self.lock:
+            with open(self.path + '.tmp', 'w') as index_file:
+                json.dump(self.entries, index_file, indent = 1, sort_keys = True)
+            os.rename(self.path + '.tmp', self.path)
+            self.changed = False
+
+        return
@@ -4,23 +4,42 @@
 # @Last Modified by:   Charles Starr
 # @Last Modified time: 2017-10-18 00:43:07
 
-from lxml import html
-from lxml import etree
-import requests
-import string
+import argparse
 import numpy as np
 import random
-import copy
+import multiprocessing
+import os
+import time
 import csv
 import pandas as pd
 import constants
+import engine
+import fetch
+import extract
+import cache
+import snapshot
+import pipeline
+import lineups
+import output
+import checkpoint
+import results
+import scenarios
+import impact
+from player_index import PlayerIndex
+from metrics import Metrics, ProgressSink, JSONSink
 import sets
 
 
+BYE = -1
+
+
 class Owner(object):
     # create an owner class for every owner in the standings table
 
-    def __init__(self, name_complex, ID, year, league_id, wins, losses, rank):
+    def __init__(
+            self, name_complex, ID, year, league_id, wins, losses, rank,
+            fetcher, refresh=False
+            ):
         # initialize variables that will be needed for simulation
         self.name_complex = name_complex
         self.ID = ID
@@ -31,106 +50,81 @@ class Owner(object):
         self.games_played = self.wins + self.losses
         self.current_rank = rank
         self.scores = []
-        self.final_opponents = self.schedule_data()
+        self.final_opponents = self.schedule_data(fetcher, refresh)
         self.win_percentage = self.calc_win_percentage()
         self.total_points = np.sum(self.scores)
-        self.roster = self.populate_roster()
+        self.roster = self.populate_roster(fetcher, refresh)
         self.lineup_scores = []
         self.lineup_deviations = []
-        self.simulated_totals = []
-        self.simulated_wins = []
-        self.simulated_losses = []
 
-    def schedule_data(self):
-        # get info about games played and games remaining
-        schedule_url = ('http://games.espn.go.com/ffl/schedule?leagueId='
+    @classmethod
+    def from_snapshot(
+            cls, name_complex, ID, year, league_id, wins, losses, rank,
+            scores, final_opponents, roster
+            ):
+        # rebuild a scraped owner without touching ESPN
+        owner = cls.__new__(cls)
+        owner.name_complex = name_complex
+        owner.ID = ID
+        owner.year = year
+        owner.league_id = league_id
+        owner.wins = wins
+        owner.losses = losses
+        owner.games_played = wins + losses
+        owner.current_rank = rank
+        owner.scores = scores
+        owner.final_opponents = final_opponents
+        owner.win_percentage = None
+        owner.total_points = np.sum(scores)
+        owner.roster = roster
+        owner.lineup_scores = []
+        owner.lineup_deviations = []
+
+        return owner
+
+    def schedule_url(self):
+
+        return ('http://games.espn.go.com/ffl/schedule?leagueId='
             + self.league_id + '&teamId=' + self.ID + '&seasonId=' + self.year
             )
-        raw_schedule = requests.get(schedule_url)
-        html_schedule = html.fromstring(raw_schedule.text)
-        opponents = []
 
-        for index, score in enumerate(
-	        	html_schedule.xpath('//nobr/a/text()'), 0
-	        	):
-            if not 'Box' in score:
-                score = float(
-                	score[string.find(score, ' ') + 1:string.find(score, '-')]
-                    )
-                self.scores.append(score)
-            else:
-                opponents.append(
-                	html_schedule.xpath('//a[@target="_top"]/@title')[index]
-                )
+    def schedule_data(self, fetcher, refresh=False):
+        # get info about games played and games remaining
+        scores, opponents = extract.schedule(
+            fetcher.get(self.schedule_url(), refresh).text
+            )
+        self.scores.extend(scores)
 
         return opponents
 
+    def update_schedule(self, fetcher):
+        # fold in scores from weeks finished since the last scrape
+
+        scores, opponents = extract.schedule(
+            fetcher.get(self.schedule_url(), refresh = True).text
+            )
+        self.scores.extend(scores[len(self.scores):])
+        self.final_opponents = opponents
+        self.total_points = np.sum(self.scores)
+
+        return
+
     def calc_win_percentage(self):
 
         self.win_percentage = float(self.wins) / len(self.scores)
 
-    def populate_roster(self):
+    def populate_roster(self, fetcher, refresh=False):
 
         roster_url = (
         	'http://games.espn.com/ffl/clubhouse?leagueId=' + self.league_id
         	+ '&teamId=' + self.ID + '&seasonId=' + self.year
             )
-        raw_roster = requests.get(roster_url)
-        html_roster = html.fromstring(raw_roster.text)
-        roster = []
-
-        for player_row in html_roster.xpath(
-        	    '//tr[contains(@class, "pncPlayerRow")]'):
-            if player_row.xpath('./td[1]/text()')[0] != 'IR':
-                try:
-                    player_name = player_row.xpath('./td[2]/a/text()')[0]
-                    position_raw = player_row.xpath('./td[2]/text()')[0]
-                    position = position_raw[
-                        position_raw.find(u'\xa0') + 1:
-                        ].strip(u'\xa0')
-                    roster.append(Player(player_name, position))
-                except:
-                    continue
 
-        return roster
-
-    def set_lineups(self, league):
-
-        for week in range(0, 17, 1):
-            positions = [
-                'QB', 'RB', 'RB', 'WR', 'WR', 'TE', 'FLEX', 'K', 'D/ST'
-                ]
-            weekly_scores = []
-            weekly_deviations = []
-            self.roster.sort(
-            	key = lambda player: player.projected_scores[week],
-            	reverse = True
-            	)
-
-            for player in self.roster:
-                if player.position in positions:
-                    weekly_scores.append(player.projected_scores[week])
-                    weekly_deviations.append(player.scoring_stdev)
-                    positions.remove(player.position)
-                elif 'FLEX' in positions and player.position in [
-                        'RB', 'WR', 'TE'
-                        ]:
-                    weekly_scores.append(player.projected_scores[week])
-                    weekly_deviations.append(player.scoring_stdev)
-                    positions.remove('FLEX')
-                else:
-                    continue
-
-            for position in positions:
-                weekly_scores.append(league.positional_scores[position])
-                weekly_deviations.append(
-                	league.positional_deviations[position]
-                	)
-            
-            self.lineup_scores.append(weekly_scores)
-            self.lineup_deviations.append(weekly_deviations)
-
-        return
+        return [
+            Player(player_name, position)
+            for player_name, position
+            in extract.roster(fetcher.get(roster_url, refresh).text)
+            ]
 
     def __cmp__(self, other):
 
@@ -150,47 +144,6 @@ class Owner(object):
         return self.name_complex
 
 
-class SimulationOwner(Owner):
-    #a copy of each owner is created for each simulation
-    
-    def __init__(self, owner): #passing owners from ownerlist for temporary sim class
-
-        self.owner = owner
-        self.name_complex = owner.name_complex
-        self.wins = owner.wins
-        self.losses = owner.losses
-        self.games_played = owner.games_played      
-        self.scores = copy.deepcopy(owner.scores)
-        self.total_points = owner.total_points
-        self.final_opponents = owner.final_opponents
-        self.lineup_scores = np.array(owner.lineup_scores)
-        self.lineup_deviations = np.array(owner.lineup_deviations)
-        self.simulated_points = self.simulate_point_total() #simulated point total
-        self.final_rank = 0
-    
-    def simulate_point_total(self):
-    	print self.name_complex
-        simulated_points = []
-        for game in range(self.games_played, 13, 1):
-            scores = self.lineup_scores[game]
-            deviations = self.lineup_deviations[game]
-            game_score = 0.0
-            
-            for score, deviation in np.nditer([scores, deviations]):
-                player_score = (random.gauss(score, deviation))
-                if player_score < 0.0:
-                    player_score = 0.0
-                game_score += player_score
-            simulated_points.append(game_score)
-        
-        self.total_points += sum(simulated_points)
-        self.scores.extend(simulated_points)
-        self.owner.simulated_totals.append(self.total_points)
-        print simulated_points
-
-        return simulated_points
-
-
 class Player(object):
 
 
@@ -199,11 +152,18 @@ class Player(object):
         self.player_name = self.name_trim(player_name)
         self.position = position
         self.game_scores = []
+        # running sums of the scraped games, so stats update in O(new games)
+        self.score_count = 0
+        self.score_sum = 0.0
+        self.score_squares = 0.0
+        # current season games seen, None when only the totals are known
+        self.season_games = None
         self.full_team = None
         self.abbr_team = None
         self.scoring_average = 0.0
         self.scoring_stdev = 0.0
         self.schedule = []
+        self.projection_row = None
         self.projected_scores = []
 
     def name_trim(self, player_name):
@@ -216,27 +176,36 @@ class Player(object):
 
         return player_name
 
-    def calculate_scoring_stats(self, positional_average, lookback):
-
-        score_count = lookback - len(self.game_scores)
-        if score_count > 0:
-            self.game_scores.extend([positional_average]*score_count)
-        self.scoring_average = np.mean(self.game_scores)
-        self.scoring_stdev = np.std(self.game_scores)
+    def add_scores(self, scores, index=None):
+        # index places the scores inside game_scores, the end by default
+        if index is None:
+            self.game_scores.extend(scores)
+        else:
+            self.game_scores[index:index] = scores
+        self.score_count += len(scores)
+        self.score_sum += sum(scores)
+        self.score_squares += sum(score * score for score in scores)
 
         return
 
-    def make_projections(self, schedule_table, defense_matrix):
+    def clear_scores(self):
 
-        schedule = schedule_table.loc[self.full_team, :]
-        for opponent in schedule:
-            if opponent == 'Bye':
-                self.projected_scores.append(0.0)
-            else:
-                self.projected_scores.append(
-                    self.scoring_average
-                    * defense_matrix.loc[opponent, self.position]
-                    )
+        self.game_scores = []
+        self.score_count = 0
+        self.score_sum = 0.0
+        self.score_squares = 0.0
+
+        return
+
+    def calculate_scoring_stats(self, positional_average, lookback):
+        # short histories are padded out to lookback games with the
+        # positional average
+        padding = max(lookback - self.score_count, 0)
+        count = self.score_count + padding
+        average = (self.score_sum + padding * positional_average) / count
+        squares = self.score_squares + padding * positional_average ** 2
+        self.scoring_average = average
+        self.scoring_stdev = np.sqrt(max(squares / count - average ** 2, 0.0))
 
         return
 
@@ -247,9 +216,83 @@ class Player(object):
 
 class Simulation(object):
 
+    # scraping stages depend on complete_weeks so a new week scrapes again
+    scrape_params = (
+        'league_id', 'stats_id', 'year', 'complete_weeks', 'load_snapshot'
+        )
+    stages = [
+        pipeline.Stage(
+            'populate_owners', 'scrape_owners', scrape_params,
+            ('owner_list', 'rank_table', 'output_table', 'player_list')
+            ),
+        pipeline.Stage(
+            'populate_stats', 'scrape_stats', scrape_params,
+            ('position_totals', 'team_dict')
+            ),
+        pipeline.Stage(
+            'populate_defense_stats', 'scrape_defense_stats', scrape_params,
+            ('defense_matrix',)
+            ),
+        pipeline.Stage(
+            'populate_schedule', 'scrape_schedule', scrape_params,
+            ('schedule_table',)
+            ),
+        pipeline.Stage(
+            'save_snapshot', 'write_snapshot', ('save_snapshot',),
+            memoize=False
+            ),
+        pipeline.Stage(
+            'calculate_player_stats', 'calculate_player_stats', ('lookback',),
+            ('positional_scores', 'positional_deviations', 'player_list')
+            ),
+        pipeline.Stage(
+            'adjust_player_projections', 'adjust_player_projections', (),
+            ('player_list', 'projections')
+            ),
+        pipeline.Stage(
+            'set_lineups', 'set_lineups', (),
+            (
+                'owner_list', 'lineup_scores', 'lineup_deviations',
+                'lineup_players'
+                )
+            ),
+        pipeline.Stage(
+            'run_simulation', 'run_simulation',
+            (
+                'sim_count', 'batch_size', 'seed', 'target_error', 'sampling',
+                'results_mode', 'keep_scenarios', 'backend', 'keep_impact'
+                ),
+            ('rank_table', 'sims_run', 'batch_squares', 'batches_run'),
+            transient=('results', 'scenarios', 'impact')
+            ),
+        pipeline.Stage(
+            'calculate_percentages', 'calculate_percentages', (),
+            ('rank_table',)
+            ),
+        pipeline.Stage(
+            'finish_simulation', 'finish_simulation', memoize=False
+            ),
+        ]
+
+    # the batch means behind standard errors are only trusted, and a run
+    # only stops on target_error, after this many batches
+    min_error_batches = 10
+
+    # weighted defense-vs-position totals keyed by
+    # (season, complete_weeks, stats_id), shared by every league in a
+    # process, one complete_weeks per season and stats_id
+    defense_cache = {}
 
     def __init__(
-    	    self, league_id, stats_id, year, complete_weeks, lookback, sim_count
+    	    self, league_id, stats_id, year, complete_weeks, lookback, sim_count,
+    	    batch_size=10000, seed=None, workers=1, fetcher=None,
+    	    load_snapshot=None, save_snapshot=None, cache_dir=None,
+    	    player_index=None, target_error=None, sampling='independent',
+    	    pool=None, output_dir='.', metrics=None, output_format='excel',
+    	    live_output=False, checkpoint=None, checkpoint_interval=300,
+    	    resume=False, results_mode='full', results_dir=None,
+    	    keep_scenarios=False, backend='numpy', keep_impact=False,
+    	    cache_max_age=None, refresh=False, measure_memory=False
     	    ):
 
         self.league_id = league_id
@@ -257,35 +300,215 @@ class Simulation(object):
         self.year = year
         self.complete_weeks = complete_weeks
         self.lookback = lookback
+        # with a target_error, in percentage points, sim_count is the cap
         self.sim_count = sim_count
-        self.owner_list = self.populate_owners()
+        self.target_error = target_error
+        self.sampling = sampling
+        self.batch_size = batch_size
+        # checkpoint is an .npz path written every checkpoint_interval
+        # seconds of simulating; resume picks it up and its seed with it
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+        self.resume = resume
+        if seed is None:
+            seed = self.checkpoint_seed()
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(32)
+        self.seed = seed
+        # with a shared pool, workers is that pool's size
+        self.workers = workers
+        self.pool = pool
+        self.output_dir = output_dir
+        # live_output rewrites both tables after every batch of a run
+        self.writer = output.make_writer(output_format, output_dir)
+        self.live_output = live_output
+        # 'full' keeps every simulated season, memory mapped under
+        # results_dir if given, 'streaming' only running aggregates
+        self.results_mode = results_mode
+        self.results_dir = results_dir
+        # keep_scenarios stores every sim's final ranks and next week
+        # results so conditional_odds and clinch_table need no new sims
+        self.keep_scenarios = keep_scenarios
+        # keep_impact stores every sim's weekly points and playoff finish
+        # so player_impact_table and slot_impact_table need no new sims
+        self.keep_impact = keep_impact
+        # 'numba' runs the fused kernel in kernels.py, 'auto' picks it when
+        # numba is installed; the two backends draw different numbers
+        self.backend = backend
+        self.metrics = metrics or Metrics()
+        # a fetcher passed in may be shared by other leagues, so its
+        # requests are counted by whatever metrics it was built with
+        self.fetcher = fetcher or fetch.Fetcher(metrics = self.metrics)
+        self.player_index = player_index or PlayerIndex()
+        self.load_snapshot = load_snapshot
+        self.save_snapshot = save_snapshot
+        self.league_state = None
+        # save_snapshot stage fingerprint the snapshot file was written at
+        self.snapshot_fingerprint = None
+        # refresh scrapes the first run past the response cache and rebuilds
+        # this league's entry in defense_cache; later reruns use the cache
+        self.refresh = refresh
+        # artifacts under cache_dir hold scraped state, so they should not
+        # outlive the http cache's pages, see ResponseCache.shortest_ttl
+        # measure_memory records each stage's peak memory, only for a
+        # Simulation that has its process to itself
+        self.pipeline = pipeline.Pipeline(
+            self, self.stages, cache_dir, self.metrics, cache_max_age,
+            measure_memory
+            )
+        self.pipeline.run()
+        self.refresh = False
+        self.metrics.close()
+
+    def rerun(self, **changes):
+        # only stages whose params, or upstream params, changed are redone
+        for name, value in changes.iteritems():
+            setattr(self, name, value)
+        self.pipeline.run()
+        self.metrics.close()
+
+        return
+
+    def run_stage(self, name):
+
+        return self.pipeline.run_stage(name)
+
+    def update_week(self):
+        # after a week finishes: fresh standings and owner scores, and only
+        # this season's new games folded into the running totals, then the
+        # stages after calculate_player_stats run on the updated state
+        self.complete_weeks += 1
+        self.update_owners()
+        self.owner_list.sort(key = lambda owner: owner.current_rank)
         self.rank_table = self.build_rank_table()
         self.output_table = self.build_out_table()
         self.owner_list.sort(reverse=True)
-        self.positional_scores = {
-                                'QB': [], 'RB': [], 'WR': [],
-                                'TE': [], 'K': [], 'D/ST': []
-                                }
-        self.positional_deviations = copy.deepcopy(self.positional_scores)
-        self.team_dict = {}
-        self.player_list = self.populate_players()
-        self.populate_stats()
-        self.populate_defense_teams()
+        self.update_player_stats()
+        self.populate_defense_stats(refresh = True)
         self.calculate_player_stats()
-        self.defense_matrix = self.build_defense_matrix()
-        self.populate_defense_stats()
-        self.schedule_table = self.build_schedule_table()
-        self.populate_schedule()
-        self.adjust_player_projections()
-        self.set_lineups()
-        self.run_simulation()
-        self.calculate_percentages()
-        self.finish_simulation()
+        self.pipeline.adopt('calculate_player_stats')
+        self.pipeline.run()
+        self.metrics.close()
+
+        return
+
+    def snapshot_state(self):
+
+        if self.league_state is None:
+            self.league_state = snapshot.load_snapshot(
+                self.load_snapshot,
+                dict(
+                    (key, getattr(self, key)) for key in snapshot.LEAGUE_KEYS
+                    )
+                )
+
+        return self.league_state
+
+    def scrape_owners(self):
+
+        if self.load_snapshot is None:
+            self.owner_list = self.populate_owners()
+        else:
+            self.owner_list = self.restore_owners(
+                self.snapshot_state()['owners']
+                )
+        self.rank_table = self.build_rank_table()
+        self.output_table = self.build_out_table()
+        self.owner_list.sort(reverse=True)
+        self.player_list = self.populate_players()
+
+        return
+
+    def scrape_stats(self):
+        # (games, sum, sum of squares) of every scraped game per position
+        self.position_totals = dict(
+            (position, np.zeros(3))
+            for position in ('QB', 'RB', 'WR', 'TE', 'K', 'D/ST')
+            )
+        if self.load_snapshot is None:
+            self.team_dict = {}
+            self.populate_stats()
+            self.populate_defense_teams()
+        else:
+            self.team_dict = self.snapshot_state()['team_dict']
+        for player in self.player_list:
+            self.add_position_totals(player, 1)
+
+        return
+
+    def add_position_totals(self, player, sign):
+        # sign -1 takes a player's games back out
+        self.position_totals[player.position] += sign * np.array([
+            player.score_count, player.score_sum, player.score_squares
+            ])
+
+        return
+
+    def scrape_defense_stats(self):
+
+        if self.load_snapshot is None:
+            self.defense_matrix = self.build_defense_matrix()
+            self.populate_defense_stats(self.refresh)
+        else:
+            self.defense_matrix = self.snapshot_state()['defense_matrix']
+
+        return
+
+    def scrape_schedule(self):
+
+        if self.load_snapshot is None:
+            self.schedule_table = self.build_schedule_table()
+            self.populate_schedule()
+        else:
+            self.schedule_table = self.snapshot_state()['schedule_table']
+
+        return
+
+    def write_snapshot(self):
+        # the fingerprint covers every scrape stage above, so a rerun that
+        # only restored them leaves an existing snapshot file alone
+        if self.save_snapshot is None:
+            return
+        fingerprint = self.pipeline.fingerprint('save_snapshot')
+        if (
+                fingerprint == self.snapshot_fingerprint
+                and os.path.exists(self.save_snapshot)
+                ):
+            return
+        snapshot.save_snapshot(self, self.save_snapshot)
+        self.snapshot_fingerprint = fingerprint
+
+        return
+
+    def restore_owners(self, owners):
+
+        owner_list = []
+        for owner in owners:
+            roster = []
+            for entry in owner['roster']:
+                player = Player(entry['player_name'], entry['position'])
+                player.player_name = entry['player_name']
+                player.full_team = entry['full_team']
+                player.abbr_team = entry['abbr_team']
+                player.add_scores(entry['game_scores'])
+                roster.append(player)
+            owner_list.append(Owner.from_snapshot(
+                owner['name_complex'], owner['ID'], self.year,
+                self.league_id, owner['wins'], owner['losses'],
+                owner['rank'], owner['scores'], owner['final_opponents'],
+                roster
+                ))
+
+        return owner_list
 
     def populate_owners(self):
         #specific owner population method for each league type
         pass
 
+    def update_owners(self):
+        #specific weekly standings update for each league type
+        pass
+
     def build_rank_table(self):
     	
         table = pd.DataFrame(
@@ -300,7 +523,9 @@ class Simulation(object):
     def build_out_table(self):
 
         columns = ['Current Wins', 'Current Rank', 'Current Points',
-            'Projected Wins', 'Projected Points', 'Playoff Odds'
+            'Projected Wins', 'Wins 10th Pct', 'Wins 90th Pct',
+            'Projected Points', 'Projected Points SD', 'Points 10th Pct',
+            'Points 90th Pct', 'Playoff Odds', 'Playoff Odds SE'
             ]
         table = pd.DataFrame(
         	0, index=[owner.name_complex for owner in self.owner_list],
@@ -320,72 +545,141 @@ class Simulation(object):
 
     def populate_stats(self):
 
+        for player, (player_url, team, game_scores, season_scores) in zip(
+                self.player_list, self.fetch_player_pages(self.refresh)
+                ):
+            if player.position != 'D/ST':
+                self.set_team_info(player, team)
+                self.player_index.record(player, player_url)
+            player.add_scores(game_scores)
+            player.season_games = len(season_scores)
+
+        self.player_index.save()
+
+        return
+
+    def update_player_stats(self):
+        # only games this season past the ones already counted are added,
+        # to the player and to the position totals; season scores come
+        # newest first, so the new games are the front of the season and go
+        # in front of game_scores; players restored from a snapshot have no
+        # season boundary and are scraped in full again
+
+        pages = self.fetch_player_pages(refresh = True)
+        for player, (player_url, team, game_scores, season_scores) in zip(
+                self.player_list, pages
+                ):
+            if player.position != 'D/ST':
+                self.set_team_info(player, team)
+                self.player_index.record(player, player_url)
+            self.add_position_totals(player, -1)
+            if player.season_games is None:
+                player.clear_scores()
+                player.add_scores(game_scores)
+            else:
+                new_games = max(len(season_scores) - player.season_games, 0)
+                player.add_scores(season_scores[:new_games], 0)
+            player.season_games = len(season_scores)
+            self.add_position_totals(player, 1)
+
+        self.player_index.save()
+
+        return
+
+    def fetch_player_pages(self, refresh=False):
+
         url_preamble = 'http://www.fftoday.com'
         league_url = '?LeagueID=' + self.stats_id
         defense_url = (
         	url_preamble + '/stats/playerstats.php?Season=' + 
             self.year + '&PosID=99&leagueID=' + self.stats_id
             )
-        defense_table = html.fromstring(requests.get(defense_url).text)
-
-        for player in self.player_list:
-            if player.position != 'D/ST':
-                last_name = player.player_name[
-                    player.player_name.find(' ') + 1:
-                    ]
-                url = url_preamble + '/stats/players?Search=' + last_name
-                raw_player = None
-                raw_search = requests.get(url)
+        defense_links = extract.defense_links(
+            self.fetcher.get(defense_url, refresh).text
+            )
 
-                if raw_search.url == url:
-                    raw_player = self.get_player_page(
-                    	raw_search, player, league_url
-                    	)
-                else:
-                    raw_player = requests.get(raw_search.url + league_url)
+        return self.fetcher.map(
+            lambda player: self.get_player_pages(
+                player, defense_links, url_preamble, league_url, refresh,
+                not refresh or player.season_games is None
+                ),
+            self.player_list
+            )
 
-                html_player = html.fromstring(raw_player.text)
-                self.extract_team_info(player, html_player)
-                self.extract_games(player, html_player)
+    def get_player_pages(
+            self, player, defense_links, url_preamble, league_url,
+            refresh=False, full=True
+            ):
+        # runs on the fetch threads, downloads and parses pages into
+        # (player url, (full team, abbreviation), game scores, this season's
+        # scores); without full only this season's log is parsed and game
+        # scores are left empty
+        def scores(html_player):
+            season_scores = extract.season_scores(html_player)
+            if full:
+                return extract.game_scores(html_player), season_scores
+            return [], season_scores
+
+        if player.position != 'D/ST':
+            entry = self.player_index.lookup(player)
+            if entry is not None:
+                html_player = extract.parse(self.fetcher.get(
+                    entry['url'] + league_url, refresh
+                    ).text)
+                if extract.has_team_info(html_player):
+                    return (
+                        (entry['url'], extract.team_info(html_player))
+                        + scores(html_player)
+                        )
+                self.player_index.forget(player)
+
+            last_name = player.player_name[
+                player.player_name.find(' ') + 1:
+                ]
+            url = url_preamble + '/stats/players?Search=' + last_name
+            raw_search = self.fetcher.get(url)
 
+            if raw_search.url == url:
+                player_url = self.get_player_url(raw_search, player)
             else:
-                for entry in defense_table.xpath('//td[@class="sort1"]/a'):
-                    if player.player_name[:-5] in entry.xpath('./text()')[0]:
-                        url = (
-                        	url_preamble + entry.xpath('./@href')[0] 
-                        	+ self.stats_id
-                        	)
-                        html_defense = html.fromstring(requests.get(url).text)
-                        self.extract_games(player, html_defense)
+                player_url = raw_search.url
+            html_player = extract.parse(
+                self.fetcher.get(player_url + league_url, refresh).text
+                )
+
+            return (
+                (player_url, extract.team_info(html_player))
+                + scores(html_player)
+                )
 
-            self.positional_scores[player.position].extend(player.game_scores)
+        game_scores = []
+        season_scores = []
+        for team_name, href in defense_links:
+            if player.player_name[:-5] in team_name:
+                url = url_preamble + href + self.stats_id
+                team_scores = scores(
+                    extract.parse(self.fetcher.get(url, refresh).text)
+                    )
+                game_scores.extend(team_scores[0])
+                season_scores.extend(team_scores[1])
 
-        return
+        return None, None, game_scores, season_scores
 
-    def get_player_page(self, raw_search, player, league_url):
+    def get_player_url(self, raw_search, player):
+        # the last matching search result is the one that was always used,
+        # so only that page gets fetched
 
-        html_search = html.fromstring(raw_search.text)
-        raw_player = None
-        for search_result in html_search.xpath(
-        	    '//span[@class="bodycontent"]'
-        	    ):
-            result_info = search_result.xpath('./a/text()')[0]
-            first_name = player.player_name[:player.player_name.find(' ')]
+        player_url = None
+        first_name = player.player_name[:player.player_name.find(' ')]
+        for result_info, href in extract.search_results(raw_search.text):
             if first_name in result_info and player.position in result_info:
-                raw_player = requests.get('http://fftoday.com' +
-                search_result.xpath('./a/@href')[0] + league_url
-                )
+                player_url = 'http://fftoday.com' + href
         
-        return raw_player
+        return player_url
 
-    def extract_team_info(self, player, html_player):
+    def set_team_info(self, player, team):
 
-        raw_team = html_player.xpath('//td[@class = "update"]/text()')[0]
-        full_team = raw_team[raw_team.find(',') + 2:]
-        abbr_team = html_player.xpath(
-                    """//span[contains(text(), "Season")]/following::table[1]
-                    //tr[last()]/td[2]/text()"""
-                    )[0]
+        full_team, abbr_team = team
         player.full_team = full_team
         player.abbr_team = abbr_team
         if full_team != 'Free Agent':
@@ -393,26 +687,6 @@ class Simulation(object):
 
         return
 
-    def extract_games(self, player, html_player):
-        
-        for yearly_log in html_player.xpath(
-            '//span[contains(text(), "Gamelog")]/following::table[1]'
-            ):
-            
-            temp_scores = []
-            for game in yearly_log.xpath('.//tr'):
-                try:
-                    int(game.xpath('./td[@class="sort1"]/text()')[0])
-                    temp_scores.append(
-                    	float(game.xpath('./td[@class="sort1"]/text()')[-1])
-                    	)
-                except:
-                    continue
-            
-            player.game_scores.extend(temp_scores[::-1])
-
-        return
-
     def populate_defense_teams(self):
 
         for player in self.player_list:
@@ -425,12 +699,17 @@ class Simulation(object):
         return
 
     def calculate_player_stats(self):
-
-        for position in self.positional_scores.iterkeys():
-            mean = np.mean(self.positional_scores[position])
-            stdev = np.std(self.positional_scores[position])
+        # from the running totals, so a new week costs only its own games
+        self.positional_scores = {}
+        self.positional_deviations = {}
+        for position, (count, total, squares) in (
+                self.position_totals.iteritems()
+                ):
+            mean = total / count
             self.positional_scores[position] = mean
-            self.positional_deviations[position] = stdev
+            self.positional_deviations[position] = np.sqrt(
+                max(squares / count - mean ** 2, 0.0)
+                )
 
         for player in self.player_list:
             player.calculate_scoring_stats(
@@ -443,45 +722,80 @@ class Simulation(object):
 
         matrix = pd.DataFrame(
         	0, index = self.team_dict.keys(), 
-            columns = self.positional_scores.keys()
+            columns = self.position_totals.keys()
             )
 
         return matrix
 
-    def populate_defense_stats(self):
-
-        for position in constants.positional_codes.iterkeys():
-            week_fraction = self.complete_weeks/float(12)
-            for year in range(int(self.year), int(self.year) - 2, -1):
-                url = (
-                	'http://fftoday.com/stats/fantasystats.php?Season='
-                	+ str(year) + '&GameWeek=Season&PosID='
-                	+ constants.positional_codes[position] 
-                	+ '&Side=Allowed&LeagueID=' + self.stats_id
-                    )
-                defense_data = requests.get(url)
-                defense_html = html.fromstring(defense_data.text)
-
-                for row in defense_html.xpath(
-                	'//tr[@class = "tableclmhdr"]/following-sibling::tr'
-                	):
-                    row_title = row.xpath('./td[1]/a/text()')[0]
-                    team = row_title[:row_title.find(' vs.')]
-                    if 'Chargers' in team and year == 2016:
-                        team = 'Los Angeles Chargers'
-                    points = float(row.xpath('./td[last()]/text()')[0])
-                    
-                    self.defense_matrix.loc[team, position] += (
-                    	points * week_fraction
-                    	)
-                week_fraction = 1 - week_fraction
-            mean = self.defense_matrix.loc[:, position].mean()
-            self.defense_matrix.loc[:, position] = (
-            	self.defense_matrix.loc[:,position]/mean
-            	)
+    def populate_defense_stats(self, refresh=False):
+
+        key = (self.year, self.complete_weeks, self.stats_id)
+        if refresh or key not in Simulation.defense_cache:
+            # only the newest week of a season and stats_id is kept, so a
+            # long lived process does not gather one table per week
+            for old in list(Simulation.defense_cache):
+                if old != key and (old[0], old[2]) == (key[0], key[2]):
+                    Simulation.defense_cache.pop(old, None)
+            Simulation.defense_cache[key] = self.weigh_defense_stats(
+                self.scrape_defense_tables(refresh)
+                )
+        positions = list(constants.positional_codes.iterkeys())
+        allowed = Simulation.defense_cache[key].reindex(
+            index = self.defense_matrix.index, columns = positions,
+            fill_value = 0.0
+            )
+        self.defense_matrix.loc[:, positions] = allowed / allowed.mean()
 
         return
 
+    def scrape_defense_tables(self, refresh=False):
+        # one long (position, year, team, points) row per table entry;
+        # refresh fetches this season's tables again, last season's are final
+
+        years = range(int(self.year), int(self.year) - 2, -1)
+        tables = [
+            (position, year)
+            for position in constants.positional_codes.iterkeys()
+            for year in years
+            ]
+        defense_pages = self.fetcher.map(
+            lambda (position, year): self.fetcher.get(
+                'http://fftoday.com/stats/fantasystats.php?Season='
+                + str(year) + '&GameWeek=Season&PosID='
+                + constants.positional_codes[position]
+                + '&Side=Allowed&LeagueID=' + self.stats_id,
+                refresh and year == int(self.year)
+                ),
+            tables
+            )
+
+        rows = []
+        for (position, year), defense_data in zip(tables, defense_pages):
+            for row_title, points in extract.defense_rows(defense_data.text):
+                rows.append((
+                    position, year, row_title[:row_title.find(' vs.')], points
+                    ))
+
+        return pd.DataFrame(
+            rows, columns = ['position', 'year', 'team', 'points']
+            )
+
+    def weigh_defense_stats(self, defense_stats):
+        # blend this season and last by how much of this season is played
+        week_fraction = self.complete_weeks/float(12)
+        defense_stats.loc[
+            defense_stats.team.str.contains('Chargers')
+            & (defense_stats.year == 2016), 'team'
+            ] = 'Los Angeles Chargers'
+        weights = np.where(
+            defense_stats.year == int(self.year),
+            week_fraction, 1 - week_fraction
+            )
+
+        return (defense_stats.points * weights).groupby(
+            [defense_stats.team, defense_stats.position]
+            ).sum().unstack(fill_value = 0.0)
+
     def build_schedule_table(self):
 
         schedule_table = pd.DataFrame(
@@ -494,188 +808,846 @@ class Simulation(object):
     def populate_schedule(self):
 
         url = 'http://fftoday.com/nfl/schedule_grid_17.html'
-        raw_schedule = requests.get(url)
-        html_schedule = html.fromstring(raw_schedule.text)
+        grid = extract.schedule_grid(self.fetcher.get(url, self.refresh).text)
         
         temp_dict = {}
         for key, value in self.team_dict.items():
             temp_dict[value] = key
         
-        for team in html_schedule.xpath(
-        	    '//td[@align = "left" and @class = "tablehdr"]'
-        	    ):
-            
-            team_abbr = team.xpath('./strong/text()')[0]
-            if team_abbr == 'Bye':
-                continue
-            full_team = temp_dict[team_abbr]
-
-            for index, matchup in enumerate(
-            	    team.xpath('./following-sibling::td'), start = 1
-            	    ):
-                opponent = matchup.xpath('./text()')
-                if opponent:
-                    opponent = opponent[0].strip('@')
-                    self.schedule_table.loc[full_team, index] = (
-                    	temp_dict[opponent]
-                    	)
+        # one row assignment per team rather than one per cell
+        for team_abbr, opponents in grid.iteritems():
+            weeks = [
+                index for index, opponent in enumerate(opponents, start = 1)
+                if opponent is not None
+                ]
+            if weeks:
+                self.schedule_table.loc[temp_dict[team_abbr], weeks] = [
+                    temp_dict[opponents[week - 1]] for week in weeks
+                    ]
 
         return
 
+    def encode_schedule(self):
+        # teams and positions as integer codes, the schedule as opponent
+        # codes with BYE for byes and an all-bye last row for free agents
+        teams = list(self.schedule_table.index)
+        team_codes = dict((team, code) for code, team in enumerate(teams))
+        schedule = np.full((len(teams) + 1, 17), BYE, dtype=np.int16)
+
+        for code, team in enumerate(teams):
+            schedule[code] = [
+                team_codes.get(opponent, BYE)
+                for opponent in self.schedule_table.loc[team, :]
+                ]
+
+        return team_codes, schedule
+
     def adjust_player_projections(self):
+        # players x 17 projections for the whole league in one gather
+        team_codes, schedule = self.encode_schedule()
+        positions = list(self.defense_matrix.columns)
+        defense = np.zeros((len(team_codes) + 1, len(positions)), np.float32)
+        defense[:-1] = self.defense_matrix.reindex(
+            index = sorted(team_codes, key = team_codes.get)
+            ).fillna(0.0).values
+
+        player_teams = np.array([
+            team_codes.get(player.full_team, len(team_codes))
+            for player in self.player_list
+            ])
+        player_positions = np.array(
+            [positions.index(player.position) for player in self.player_list]
+            )
+        averages = np.array(
+            [player.scoring_average for player in self.player_list],
+            dtype=np.float32
+            )
+        self.projections = (
+            averages[:, np.newaxis]
+            * defense[schedule[player_teams], player_positions[:, np.newaxis]]
+            )
 
-        for player in self.player_list:
-            if player.full_team != 'Free Agent':
-                player.make_projections(
-                	self.schedule_table, self.defense_matrix
-                	)
-            else:
-                player.projected_scores = [0.0] * 17
+        for row, player in enumerate(self.player_list):
+            player.projection_row = row
+            player.projected_scores = self.projections[row]
 
         return
 
     def set_lineups(self):
+        # can be called again after roster changes without other stages
+        (
+            self.lineup_scores, self.lineup_deviations, self.lineup_players
+            ) = self.optimal_lineups(
+                [owner.roster for owner in self.owner_list]
+                )
 
-        for owner in self.owner_list:
-            owner.set_lineups(self)
+        for row, owner in enumerate(self.owner_list):
+            owner.lineup_scores = self.lineup_scores[row]
+            owner.lineup_deviations = self.lineup_deviations[row]
 
         return
 
+    def optimal_lineups(self, rosters):
+        # (owners x 17 weeks x slots) scores, deviations and starting roster
+        # spots for lists of players, one list per owner
+        return lineups.optimal_lineups(
+            self.projections,
+            [player.scoring_stdev for player in self.player_list],
+            [player.position for player in self.player_list],
+            [
+                [player.projection_row for player in roster]
+                for roster in rosters
+                ],
+            self.positional_scores, self.positional_deviations
+            )
+
+    def build_lineup_arrays(self):
+        # stack the unplayed weeks of every lineup into dense
+        # (owners x weeks x slots) arrays, padding short schedules with zeros
+        weeks = max(13 - owner.games_played for owner in self.owner_list)
+        slots = len(self.owner_list[0].lineup_scores[0])
+        lineup_scores = np.zeros((len(self.owner_list), weeks, slots))
+        lineup_deviations = np.zeros_like(lineup_scores)
+
+        for row, owner in enumerate(self.owner_list):
+            remaining = 13 - owner.games_played
+            lineup_scores[row, :remaining] = (
+                owner.lineup_scores[owner.games_played:13]
+                )
+            lineup_deviations[row, :remaining] = (
+                owner.lineup_deviations[owner.games_played:13]
+                )
+
+        return lineup_scores, lineup_deviations
+
+    def build_opponent_matrix(self):
+        # integer (owners x weeks) opponent index matrix, -1 for no game
+        weeks = max(13 - owner.games_played for owner in self.owner_list)
+        owner_index = {
+            owner.name_complex: row
+            for row, owner in enumerate(self.owner_list)
+            }
+        opponents = np.full((len(self.owner_list), weeks), -1, dtype=int)
+
+        for row, owner in enumerate(self.owner_list):
+            for week in range(13 - owner.games_played):
+                opponents[row, week] = owner_index[owner.final_opponents[week]]
+
+        return opponents
+
+    def next_week_matchups(self):
+        # (first, second) owner rows for each of next week's games
+
+        opponents = self.build_opponent_matrix()[:, 0]
+
+        return [
+            (row, opponent) for row, opponent in enumerate(opponents)
+            if row < opponent
+            ]
+
+    def build_simulator(self):
+
+        lineup_scores, lineup_deviations = self.build_lineup_arrays()
+        season_games = np.array(
+            [len(owner.scores) + 13 - owner.games_played
+            for owner in self.owner_list], dtype=float
+            )
+
+        return engine.BatchSimulator(
+            lineup_scores, lineup_deviations, self.build_opponent_matrix(),
+            np.array([owner.wins for owner in self.owner_list]),
+            np.array([owner.losses for owner in self.owner_list]),
+            np.array([owner.total_points for owner in self.owner_list]),
+            season_games, self.seed, self.sampling, self.keep_scenarios,
+            self.backend, self.keep_impact
+            )
+
+    def compare_scenario(self, scenario, sim_count=None):
+        # playoff odds change from this league to a modified copy of it, such
+        # as after a trade, using common random numbers from this seed
+        names = [owner.name_complex for owner in self.owner_list]
+        simulator = self.build_simulator()
+        other = scenario.build_simulator()
+        if [owner.name_complex for owner in scenario.owner_list] != names:
+            raise ValueError('scenario owners must be in the same order')
+        other.seed = self.seed
+        other.sampling = self.sampling
+        other.backend = simulator.backend
+        change, standard_error = engine.compare_scenarios(
+            simulator, other,
+            engine.split_batches(sim_count or self.sim_count, self.batch_size)
+            )
+
+        return pd.DataFrame(
+            {'Playoff Odds Change': change, 'Standard Error': standard_error},
+            index = names
+            )
+
     def run_simulation(self):
 
-        for i in range(1, self.sim_count+1):
-            if i%1000 == 0:
-                print i
-            simulated_owners = {
-                owner.name_complex:SimulationOwner(owner) 
-                for owner in self.owner_list
-                }
-            self.play_games(simulated_owners)
-            simulated_rankings = sorted(
-            	simulated_owners.values(), reverse = True
+        self.metrics.set('seed', self.seed)
+        self.metrics.start_progress(self.sim_count)
+        simulator = self.build_simulator()
+        # sum over batches of each batch's (owners x ranks + playoffs)
+        # counts squared over its size, for batch means standard errors
+        self.batch_squares = np.zeros(
+            (len(self.owner_list), len(self.owner_list) + 1)
+            )
+        self.batches_run = 0
+        batches = engine.split_batches(self.sim_count, self.batch_size)
+        self.results = results.make_results(
+            self.results_mode, len(self.owner_list), self.sim_count,
+            self.results_dir
+            )
+        self.scenarios = None
+        if self.keep_scenarios:
+            self.scenarios = scenarios.ScenarioStore(
+                [owner.name_complex for owner in self.owner_list],
+                self.next_week_matchups(), self.sim_count
                 )
-            self.wild_card(simulated_rankings)
-            self.update_table(simulated_rankings)
-
-    def play_games(self, simulated_owners):
-
-        for sim_owner in simulated_owners.itervalues():         
-            for index, week_simulation in enumerate(sim_owner.simulated_points):
-                opponent = simulated_owners[sim_owner.final_opponents[index]]
-                opp_name = opponent.name_complex
-                if (
-                	    week_simulation 
-                	    > simulated_owners[opp_name].simulated_points[index]
-                	    ):
-                    sim_owner.wins += 1
-                elif (
-                	    week_simulation 
-                	    < simulated_owners[opp_name].simulated_points[index]
-                	    ):
-                    sim_owner.losses += 1
-            sim_owner.owner.simulated_wins.append(sim_owner.wins)
-            sim_owner.owner.simulated_losses.append(sim_owner.losses)
-            sim_owner.calc_win_percentage()
-        
+        self.impact = None
+        if self.keep_impact:
+            self.impact = impact.ImpactStore(
+                [owner.name_complex for owner in self.owner_list],
+                self.sim_count, simulator.opponents.shape[1]
+                )
+        manifest = self.checkpoint_manifest(simulator)
+        next_batch, completed, finished = self.resume_checkpoint(manifest)
+        batches = [] if finished else batches[next_batch:]
+        pool = None
+        if self.pool is not None:
+            # a pool shared with other leagues gets the arrays with each task,
+            # two per worker queued so an early stop frees the pool quickly
+            batch_results = engine.windowed_imap(
+                self.pool, engine.run_league_batch,
+                ((simulator,) + batch for batch in batches),
+                2 * self.workers
+                )
+        elif self.workers > 1:
+            pool = multiprocessing.Pool(
+                self.workers, engine.init_worker, (simulator,)
+                )
+            batch_results = pool.imap(engine.run_worker_batch, batches)
+        else:
+            batch_results = (simulator.run_batch(*batch) for batch in batches)
+
+        # a private pool is shut down however the loop ends, so an error or
+        # interrupt in a long lived process leaves no workers behind
+        try:
+            next_batch, completed = self.merge_batches(
+                batch_results, manifest, next_batch, completed
+                )
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        # the last checkpoint is kept, resuming it just writes the results
+        if self.checkpoint is not None:
+            self.write_checkpoint(manifest, next_batch, completed, True)
+        self.sims_run = completed
+        self.metrics.set('simulations', completed)
+        self.metrics.set(
+            'max_standard_error', self.max_standard_error(completed)
+            )
+
         return
 
-    def wild_card(self, simulated_rankings):
+    def merge_batches(self, batch_results, manifest, next_batch, completed):
+        # folds batches into the tables in index order, checkpointing and
+        # stopping early on the way; returns the new (next batch, completed)
+        last_checkpoint = time.time()
+        for rank_counts, wins, losses, total_points, outcomes in batch_results:
+            self.update_table(rank_counts, wins, losses, total_points)
+            if outcomes is not None:
+                if self.scenarios is not None:
+                    self.scenarios.add(
+                        outcomes['final_ranks'], outcomes['next_week']
+                        )
+                if self.impact is not None:
+                    self.impact.add(
+                        outcomes['final_ranks'], outcomes['weekly_points']
+                        )
+            completed += len(wins)
+            next_batch += 1
+            self.metrics.progress(completed)
+            if self.live_output:
+                self.write_tables(self.odds_table(self.rank_table, completed))
+            # batches arrive in order, so stopping early stays reproducible
+            if (
+                    self.target_error is not None
+                    and self.batches_run >= self.min_error_batches
+                    and self.max_standard_error(completed) <= self.target_error
+                    ):
+                break
+            if (
+                    self.checkpoint is not None
+                    and time.time() - last_checkpoint
+                    >= self.checkpoint_interval
+                    ):
+                self.write_checkpoint(manifest, next_batch, completed, False)
+                last_checkpoint = time.time()
+
+        return next_batch, completed
+
+    def checkpoint_manifest(self, simulator):
+
+        return {
+            'league_id': self.league_id,
+            'stats_id': self.stats_id,
+            'year': self.year,
+            'complete_weeks': self.complete_weeks,
+            'lookback': self.lookback,
+            'seed': self.seed,
+            'sim_count': self.sim_count,
+            'batch_size': self.batch_size,
+            'sampling': self.sampling,
+            'target_error': self.target_error,
+            'results_mode': self.results_mode,
+            'keep_scenarios': self.keep_scenarios,
+            'keep_impact': self.keep_impact,
+            'backend': simulator.backend,
+            'league_digest': checkpoint.league_digest(simulator),
+            }
+
+    def write_checkpoint(self, manifest, next_batch, completed, finished):
+
+        checkpoint.save_checkpoint(
+            self.checkpoint,
+            dict(
+                manifest, next_batch = next_batch, completed = completed,
+                finished = finished
+                ),
+            # rank counts in owner_list order, like the results columns
+            self.rank_table.loc[
+                [owner.name_complex for owner in self.owner_list],
+                range(1, len(self.owner_list) + 1)
+                ].values,
+            self.batch_squares, self.results.state(),
+            self.scenarios.state() if self.scenarios is not None else None,
+            self.impact.state() if self.impact is not None else None
+            )
+
+        return
+
+    def can_resume(self):
+
+        return (
+            self.resume and self.checkpoint is not None
+            and os.path.exists(self.checkpoint)
+            )
+
+    def checkpoint_seed(self):
+        # a resumed run keeps the seed its checkpoint was drawn with
+
+        if self.can_resume():
+            return checkpoint.read_manifest(self.checkpoint)['seed']
+
+        return None
+
+    def resume_checkpoint(self, manifest):
+        # (next batch, sims completed, finished) from the checkpoint, with
+        # the rank counts and results store put back where they were
+        if not self.can_resume():
+            return 0, 0, False
+
+        state = checkpoint.load_checkpoint(self.checkpoint)
+        checkpoint.check_manifest(state['manifest'], manifest, self.checkpoint)
+        names = [owner.name_complex for owner in self.owner_list]
+        self.rank_table.loc[names, range(1, len(names) + 1)] = (
+            state['rank_counts']
+            )
+        self.batch_squares = state['batch_squares'].copy()
+        self.batches_run = state['manifest']['next_batch']
+        self.results.load_state(state['results'])
+        if self.scenarios is not None:
+            self.scenarios.load_state(state['scenarios'])
+        if self.impact is not None:
+            self.impact.load_state(state['impact'])
+
+        return (
+            state['manifest']['next_batch'], state['manifest']['completed'],
+            state['manifest']['finished']
+            )
+
+    def standard_errors(self, rank_table, completed):
+        # (owners x ranks + playoffs) standard errors in percentage points,
+        # in rank_table order, from the spread of the per-batch frequencies
+        # around the overall ones; every batch has its own stream, so this
+        # holds for antithetic and sobol draws, where the binomial error
+        # sqrt(p(1 - p) / n) overstates it; with too few batches for that
+        # the binomial error is used
+        names = [owner.name_complex for owner in self.owner_list]
+        ranks = range(1, len(names) + 1)
+        counts = rank_table.loc[names, ranks].values.astype(float)
+        counts = np.column_stack([counts, counts[:, :6].sum(axis=1)])
+        odds = counts / completed
+        if self.batches_run < self.min_error_batches:
+            variances = odds * (1 - odds) / completed
+        else:
+            variances = (
+                (self.batch_squares - completed * odds ** 2)
+                / (completed * (self.batches_run - 1))
+                )
+        errors = pd.DataFrame(
+            np.sqrt(np.maximum(variances, 0.0)) * 100, index = names,
+            columns = ranks + ['Playoff Odds']
+            )
+
+        return errors.reindex(rank_table.index)
+
+    def max_standard_error(self, completed):
+        # largest standard error, in percentage points, over every owner's
+        # playoff odds and final rank probabilities
+
+        return self.standard_errors(self.rank_table, completed).values.max()
+
+    def update_table(self, rank_counts, wins, losses, total_points):
+
+        names = [owner.name_complex for owner in self.owner_list]
+        self.rank_table.loc[names, range(1, len(names) + 1)] += rank_counts
+        counts = np.column_stack([rank_counts, rank_counts[:, :6].sum(axis=1)])
+        self.batch_squares += counts.astype(float) ** 2 / len(wins)
+        self.batches_run += 1
+
+        self.results.add(wins, losses, total_points)
 
-        wild_card = max(
-        	simulated_rankings[5:], 
-        	key = lambda sim_owner: sim_owner.total_points
-        	)
-        wild_card = simulated_rankings.pop(
-        	simulated_rankings.index(wild_card)
-        	)
-        simulated_rankings.insert(5, wild_card)
-        
         return
 
-    def update_table(self, simulated_rankings):
+    def conditional_odds(self, winners):
+        # rank and playoff odds, in percent, if every owner named in
+        # winners wins next week, and the number of sims behind them
+        if self.scenarios is None:
+            raise ValueError('conditional odds need keep_scenarios=True')
+        table, sims = self.scenarios.conditional(winners)
+
+        return table.reindex(self.rank_table.index), sims
+
+    def clinch_table(self):
+        # playoff odds under every combination of next week's results
+        if self.scenarios is None:
+            raise ValueError('a clinch table needs keep_scenarios=True')
+
+        return self.scenarios.clinch_table()[
+            list(self.rank_table.index) + ['Simulations']
+            ]
+
+    def clinch_status(self):
+        # clinched, eliminated or alive under every combination of next
+        # week's results
+        if self.scenarios is None:
+            raise ValueError('a clinch status needs keep_scenarios=True')
+
+        return self.scenarios.clinch_status()[list(self.rank_table.index)]
+
+    def lineup_moments(self, row, scores, deviations):
+        # censored moments of an owner's unplayed weeks for a full season
+        # lineup, padded to the simulated weeks like build_lineup_arrays
+        owner = self.owner_list[row]
+        remaining = 13 - owner.games_played
+        weeks = self.impact.weekly_points.shape[2]
+        means = np.zeros(weeks)
+        variances = np.zeros(weeks)
+        means[:remaining], variances[:remaining] = impact.censored_moments(
+            scores[owner.games_played:13], deviations[owner.games_played:13]
+            )
+
+        return means, variances
+
+    def impact_changes(self, row):
+        # (label, scores, deviations) lineups for one owner: each starter
+        # removed from the roster, benched with nobody in their slot, and
+        # replaced by replacement level, then each slot at replacement level
+        owner = self.owner_list[row]
+        scores = self.lineup_scores[row]
+        deviations = self.lineup_deviations[row]
+        starters = self.lineup_players[row]
+        changes = []
+        for spot, player in enumerate(owner.roster):
+            starts = starters == spot
+            if not starts[owner.games_played:13].any():
+                continue
+            roster = owner.roster[:spot] + owner.roster[spot + 1:]
+            removed = self.optimal_lineups([roster])
+            changes.append(
+                (('Removed', spot), removed[0][0], removed[1][0])
+                )
+            changes.append((
+                ('Benched', spot), np.where(starts, 0.0, scores),
+                np.where(starts, 0.0, deviations)
+                ))
+            position = player.position
+            changes.append((
+                ('Replacement', spot),
+                np.where(starts, self.positional_scores[position], scores),
+                np.where(
+                    starts, self.positional_deviations[position], deviations
+                    )
+                ))
+        flex_position = lineups.flex_replacement(self.positional_scores)
+        for slot, position in enumerate(lineups.SLOTS):
+            if position == 'FLEX':
+                position = flex_position
+            replacement_scores = scores.copy()
+            replacement_deviations = deviations.copy()
+            replacement_scores[:, slot] = self.positional_scores[position]
+            replacement_deviations[:, slot] = (
+                self.positional_deviations[position]
+                )
+            changes.append(
+                (('Slot', slot), replacement_scores, replacement_deviations)
+                )
+
+        return changes
+
+    def impact_odds(self):
+        # {change label: (playoff odds, effective sims)} per owner row
+        if self.impact is None:
+            raise ValueError('an impact table needs keep_impact=True')
+
+        return [
+            self.owner_impact_odds(row) for row in range(len(self.owner_list))
+            ]
+
+    def owner_impact_odds(self, row):
+
+        changes = self.impact_changes(row)
+        odds, effective_sims = self.impact.reweighted_odds(
+            row,
+            self.lineup_moments(
+                row, self.lineup_scores[row], self.lineup_deviations[row]
+                ),
+            [
+                self.lineup_moments(row, scores, deviations)
+                for label, scores, deviations in changes
+                ]
+            )
+
+        return dict(
+            (label, (odds[index], effective_sims[index]))
+            for index, (label, scores, deviations) in enumerate(changes)
+            )
+
+    def player_impact_table(self, impact_odds=None):
+        # playoff odds change, in percentage points, for each owner if a
+        # starter were dropped, benched or replaced by replacement level,
+        # reweighted from the main run; effective sims is the smallest
+        # effective sample size behind the three
+        impact_odds = impact_odds or self.impact_odds()
+        rows = []
+        for row, owner in enumerate(self.owner_list):
+            odds = impact_odds[row]
+            base = self.impact.playoff_odds(row)
+            for spot, player in enumerate(owner.roster):
+                if ('Removed', spot) not in odds:
+                    continue
+                starts = self.lineup_players[row, owner.games_played:13]
+                entry = {
+                    'Player': player.player_name, 'Team': owner.name_complex,
+                    'Position': player.position,
+                    'Starts': (starts == spot).any(axis = 1).sum(),
+                    'Playoff Odds': base,
+                    }
+                for change in ('Removed', 'Benched', 'Replacement'):
+                    entry[change] = odds[(change, spot)][0] - base
+                entry['Effective Sims'] = min(
+                    odds[(change, spot)][1]
+                    for change in ('Removed', 'Benched', 'Replacement')
+                    )
+                rows.append(entry)
+
+        return pd.DataFrame(rows, columns = [
+            'Player', 'Team', 'Position', 'Starts', 'Playoff Odds', 'Removed',
+            'Benched', 'Replacement', 'Effective Sims'
+            ]).set_index('Player')
+
+    def slot_impact_table(self, impact_odds=None):
+        # playoff odds change, in percentage points, for each owner with
+        # one lineup slot at replacement level for the rest of the season
+        impact_odds = impact_odds or self.impact_odds()
+        labels = [
+            position + str(lineups.SLOTS[:slot + 1].count(position))
+            if lineups.SLOTS.count(position) > 1 else position
+            for slot, position in enumerate(lineups.SLOTS)
+            ]
+        table = pd.DataFrame(
+            index = [owner.name_complex for owner in self.owner_list],
+            columns = labels + ['Effective Sims'], dtype = float
+            )
+        table.index.name = 'Team'
+        for row, owner in enumerate(self.owner_list):
+            odds = impact_odds[row]
+            base = self.impact.playoff_odds(row)
+            slots = [odds[('Slot', slot)] for slot in range(len(labels))]
+            table.iloc[row] = (
+                [change - base for change, sims in slots]
+                + [min(sims for change, sims in slots)]
+                )
+
+        return table.reindex(self.rank_table.index)
 
-        for rank, sim_owner in enumerate(simulated_rankings, 1):
-            self.rank_table[rank][sim_owner.name_complex] += 1
+    def odds_table(self, rank_table, completed):
+        # rank counts as percentages, with playoff odds and their error and
+        # the largest error of each owner's rank odds, so the error a run
+        # reached is in its output
+
+        table = rank_table.copy()
+        ranks = table.columns[1:]
+        table[ranks] = table[ranks] / float(completed) * 100
+        # from the integer counts so a clinched team is exactly 1
+        playoff_odds = rank_table.iloc[:, 1:7].sum(axis=1) / float(completed)
+        table['Playoff Odds'] = playoff_odds * 100
+        errors = self.standard_errors(rank_table, completed)
+        table['Playoff Odds SE'] = errors['Playoff Odds']
+        table['Rank Odds Max SE'] = errors[list(ranks)].max(axis=1)
+
+        return table
 
     def calculate_percentages(self):
 
-        self.rank_table.ix[:, 1:] = (
-        	self.rank_table.ix[:, 1:] / float(self.sim_count) * 100
-        	)
-        self.rank_table['Playoff Odds'] = (
-        	self.rank_table.iloc[:, 1:7].sum(axis=1)
+        self.rank_table = self.odds_table(self.rank_table, self.sims_run)
+
+        return
+
+    def power_rankings_table(self, odds):
+
+        table = self.output_table.copy()
+        projected_wins = self.results.mean('wins')
+        projected_points = self.results.mean('totals')
+        points_deviation = self.results.std('totals')
+        win_quantiles = self.results.quantiles('wins', [0.1, 0.9])
+        point_quantiles = self.results.quantiles('totals', [0.1, 0.9])
+        for row, owner in enumerate(self.owner_list):
+            name = owner.name_complex
+            table.loc[name, 'Current Wins'] = owner.wins
+            table.loc[name, 'Current Rank'] = owner.current_rank
+            table.loc[name, 'Current Points'] = owner.total_points
+            table.loc[name, 'Projected Wins'] = projected_wins[row]
+            table.loc[name, 'Wins 10th Pct'] = win_quantiles[0, row]
+            table.loc[name, 'Wins 90th Pct'] = win_quantiles[1, row]
+            table.loc[name, 'Projected Points'] = projected_points[row]
+            table.loc[name, 'Projected Points SD'] = points_deviation[row]
+            table.loc[name, 'Points 10th Pct'] = point_quantiles[0, row]
+            table.loc[name, 'Points 90th Pct'] = point_quantiles[1, row]
+            table.loc[name, 'Playoff Odds'] = odds.loc[name, 'Playoff Odds']
+            table.loc[name, 'Playoff Odds SE'] = (
+                odds.loc[name, 'Playoff Odds SE']
+                )
+        table.sort_values(
+        	by = 'Projected Points', ascending = False, inplace = True
         	)
 
+        return table
+
+    def win_distribution_table(self):
+        # percent of simulated seasons each owner finishes on each win total
+
+        distribution = self.results.win_distribution() * 100
+        table = pd.DataFrame(
+            distribution,
+            index = [owner.name_complex for owner in self.owner_list],
+            columns = range(distribution.shape[1])
+            )
+        table.index.name = 'Team'
+
+        return table
+
+    def write_tables(self, odds):
+
+        self.writer.write('playoff_odds', odds)
+        self.writer.write('power_rankings', self.power_rankings_table(odds))
+        self.writer.write('win_distribution', self.win_distribution_table())
+
         return
 
     def finish_simulation(self):
 
-        writer = pd.ExcelWriter('playoff_odds.xlsx')
-        self.rank_table.to_excel(writer)
-        writer.save()
+        self.output_table = self.power_rankings_table(self.rank_table)
+        self.writer.write('playoff_odds', self.rank_table)
+        self.writer.write('power_rankings', self.output_table)
+        self.writer.write('win_distribution', self.win_distribution_table())
+        if self.scenarios is not None:
+            self.writer.write('next_week_scenarios', self.clinch_table())
+            self.writer.write('next_week_status', self.clinch_status())
+        if self.impact is not None:
+            impact_odds = self.impact_odds()
+            self.writer.write(
+                'player_impact', self.player_impact_table(impact_odds)
+                )
+            self.writer.write(
+                'slot_impact', self.slot_impact_table(impact_odds)
+                )
 
-        writer = pd.ExcelWriter('power_rankings.xlsx')
-        for owner in self.owner_list:
-            name = owner.name_complex
-            self.output_table.loc[name, 'Current Wins'] = owner.wins
-            self.output_table.loc[name, 'Current Rank'] = owner.current_rank
-            self.output_table.loc[name, 'Current Points'] = owner.total_points
-            self.output_table.loc[name, 'Projected Wins'] = np.mean(
-            	owner.simulated_wins
-            	)
-            self.output_table.loc[name, 'Projected Points'] = np.mean(
-            	owner.simulated_totals
-            	)
-            playoff_odds = self.rank_table.loc[name, 'Playoff Odds']
-            self.output_table.loc[name, 'Playoff Odds'] = playoff_odds
-        self.output_table.sort(
-        	columns = 'Projected Points', ascending = False, inplace = True
-        	)
-        self.output_table.to_excel(writer)
-        writer.save()
+        return
 
 
 class ESPNSimulation(Simulation):
 
 
     def __init__(
-    	    self, league_id, stats_id, year, complete_weeks, lookback, sim_count
+    	    self, league_id, stats_id, year, complete_weeks, lookback, sim_count,
+    	    **kwargs
     	    ):
 
-        super(ESPNSimulation, self).__init__(league_id, stats_id, year, complete_weeks, lookback, sim_count)
+        super(ESPNSimulation, self).__init__(league_id, stats_id, year, complete_weeks, lookback, sim_count, **kwargs)
 
-    def populate_owners(self):
+    def standings_url(self):
 
-        owner_list = []    
-        standings_url = (
+        return (
         	'http://games.espn.go.com/ffl/standings?leagueId=' 
         	+ self.league_id + '&seasonId=' + self.year
         	)
-        raw_standings = requests.get(standings_url)
-        html_standings = html.fromstring(raw_standings.text)
+
+    def populate_owners(self):
+
+        owner_entries = []    
+        raw_standings = self.fetcher.get(self.standings_url(), self.refresh)
         rank = 1
 
-        for standings_entry in html_standings.xpath(
-        	    '//tr[@class="tableBody"]'
-        	    ):
-            name_complex = standings_entry.xpath('./td/a[@title]/@title')[0]
-            id_reference = standings_entry.xpath('./td/a[@title]/@href')[0]
-            ID = id_reference[string.find(id_reference, 'teamId='):]
-            ID = ID[7:string.find(ID, '&seasonId=')]
-            wins = int(standings_entry.xpath('./td[2]/text()')[0])
-            losses = int(standings_entry.xpath('./td[3]/text()')[0])
-            new_owner = Owner(
+        for name_complex, ID, wins, losses in extract.standings(
+                raw_standings.text
+                ):
+            owner_entries.append((
                 name_complex, ID, self.year, self.league_id, 
-                wins, losses, rank
-                )
-            owner_list.append(new_owner)
+                wins, losses, rank, self.fetcher, self.refresh
+                ))
             rank += 1
 
+        # each owner fetches its schedule and clubhouse pages
+        owner_list = self.fetcher.map(
+            lambda entry: Owner(*entry), owner_entries
+            )
+
         return owner_list
 
+    def update_owners(self):
+        # records and ranks from fresh standings, new scores from each
+        # owner's schedule page; rosters are kept
+        owners = dict((owner.ID, owner) for owner in self.owner_list)
+        raw_standings = self.fetcher.get(self.standings_url(), refresh = True)
+        for rank, (name_complex, ID, wins, losses) in enumerate(
+                extract.standings(raw_standings.text), start = 1
+                ):
+            owner = owners[ID]
+            owner.wins = wins
+            owner.losses = losses
+            owner.games_played = wins + losses
+            owner.current_rank = rank
+        self.fetcher.map(
+            lambda owner: owner.update_schedule(self.fetcher), self.owner_list
+            )
+
+        return
+
 def main():
     
-    ESPNSimulation('392872', '191290', '2017', 6, 12, 1000000)
+    parser = argparse.ArgumentParser(
+        description = 'Simulate the rest of an ESPN fantasy season.'
+        )
+    parser.add_argument('--league-id', default = '392872')
+    parser.add_argument('--stats-id', default = '191290')
+    parser.add_argument('--year', default = '2017')
+    parser.add_argument('--complete-weeks', type = int, default = 6)
+    parser.add_argument('--lookback', type = int, default = 12)
+    parser.add_argument('--sims', type = int, default = 1000000)
+    parser.add_argument(
+        '--seed', type = int,
+        help = 'repeat an earlier run, its seed is printed at the end'
+        )
+    parser.add_argument(
+        '--target-error', type = float,
+        help = 'stop once playoff odds standard errors are below this many '
+        'percentage points, with --sims as the cap'
+        )
+    parser.add_argument(
+        '--sampling', default = 'independent', choices = engine.SAMPLING_MODES,
+        help = 'antithetic and sobol draws lower the error for a sim count'
+        )
+    parser.add_argument(
+        '--workers', type = int, default = multiprocessing.cpu_count()
+        )
+    parser.add_argument(
+        '--output-format', default = 'excel', choices = sorted(output.WRITERS)
+        )
+    parser.add_argument(
+        '--live-output', action = 'store_true',
+        help = 'rewrite the result tables after every simulation batch'
+        )
+    parser.add_argument(
+        '--results-mode', default = 'full', choices = results.RESULT_MODES,
+        help = 'streaming keeps only running aggregates of each season'
+        )
+    parser.add_argument(
+        '--results-dir', help = 'memory map full results in this directory'
+        )
+    parser.add_argument(
+        '--keep-scenarios', action = 'store_true',
+        help = 'also write playoff odds and clinches for each result next week'
+        )
+    parser.add_argument(
+        '--player-impact', action = 'store_true',
+        help = 'also write what each starter and slot is worth in odds'
+        )
+    parser.add_argument(
+        '--backend', default = 'numpy', choices = engine.KERNEL_BACKENDS,
+        help = 'numba runs a compiled kernel, auto uses it when installed'
+        )
+    parser.add_argument(
+        '--checkpoint',
+        help = 'checkpoint a long run to this .npz file, none by default'
+        )
+    parser.add_argument(
+        '--checkpoint-interval', type = float, default = 300,
+        help = 'seconds between checkpoints'
+        )
+    parser.add_argument(
+        '--resume', action = 'store_true',
+        help = 'continue from the --checkpoint left by an interrupted run'
+        )
+    parser.add_argument(
+        '--quiet', action = 'store_true',
+        help = 'no progress line or closing summary'
+        )
+    parser.add_argument(
+        '--metrics-json', help = 'also write run metrics to this json file'
+        )
+    parser.add_argument(
+        '--offline', action = 'store_true',
+        help = 'use only cached pages, failing on any that are missing'
+        )
+    args = parser.parse_args()
+    if args.resume and args.checkpoint is None:
+        parser.error('--resume needs the --checkpoint of the earlier run')
+
+    sinks = [] if args.quiet else [ProgressSink()]
+    if args.metrics_json is not None:
+        sinks.append(JSONSink(args.metrics_json))
+
+    metrics = Metrics(sinks)
+    http_cache = cache.ResponseCache('http_cache', offline=args.offline)
+    ESPNSimulation(
+        args.league_id, args.stats_id, args.year, args.complete_weeks,
+        args.lookback, args.sims,
+        seed=args.seed,
+        workers=args.workers,
+        fetcher=fetch.Fetcher(cache=http_cache, metrics=metrics),
+        cache_dir='pipeline_cache',
+        cache_max_age=http_cache.shortest_ttl(),
+        player_index=PlayerIndex('player_index.json'),
+        target_error=args.target_error,
+        sampling=args.sampling,
+        output_format=args.output_format,
+        live_output=args.live_output,
+        results_mode=args.results_mode,
+        results_dir=args.results_dir,
+        keep_scenarios=args.keep_scenarios,
+        backend=args.backend,
+        keep_impact=args.player_impact,
+        checkpoint=args.checkpoint,
+        checkpoint_interval=args.checkpoint_interval,
+        resume=args.resume,
+        measure_memory=True,
+        metrics=metrics
+        )
     '''
     league_id = raw_input('Please enter your league ID number?')
     stats_id = raw_input('Please enter your stats ID number?')
@@ -684,4 +1656,6 @@ def main():
     # ESPNSimulation(league_id, sim_number)
     ESPNSimulation(league_id, stats_id, year, sim_number)
     '''
-main()
+
+if __name__ == '__main__':
+    main()
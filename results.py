@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+# per-simulation outcomes for every owner, either kept in full as typed
+# arrays or reduced to running aggregates so memory stays flat
+
+import os
+
+import numpy as np
+
+
+FIELDS = (('wins', np.int16), ('losses', np.int16), ('totals', np.float32))
+RESULT_MODES = ('full', 'streaming')
+
+
+class ResultStore(object):
+    # the running sums every mode keeps, so means are always cheap
+
+    def __init__(self, owners):
+
+        self.owners = owners
+        self.count = 0
+        self.sums = dict(
+            (name, np.zeros(owners)) for name, dtype in FIELDS
+            )
+
+    def add(self, wins, losses, totals):
+        # one (sims x owners) array per field from a simulated batch
+        batch = {'wins': wins, 'losses': losses, 'totals': totals}
+        self.store(batch)
+        for name, values in batch.iteritems():
+            self.sums[name] += values.sum(axis=0)
+        self.count += len(wins)
+
+        return
+
+    def mean(self, name):
+
+        return self.sums[name] / self.count
+
+    def win_distribution(self):
+        # (owners x final wins) share of sims ending on each win total
+        counts = self.distribution('wins')
+
+        return counts / float(self.count)
+
+    def state(self):
+        # flat dict of arrays for a checkpoint
+        state = {'count': np.array(self.count)}
+        for name, total in self.sums.iteritems():
+            state['sums_' + name] = total
+
+        return state
+
+    def load_state(self, state):
+
+        self.count = int(state['count'])
+        for name in self.sums:
+            self.sums[name] = state['sums_' + name].copy()
+
+        return
+
+
+class FullResults(ResultStore):
+    # every outcome in preallocated int16/float32 arrays, memory mapped
+    # under directory when one is given
+
+    def __init__(self, owners, capacity, directory=None):
+
+        super(FullResults, self).__init__(owners)
+        self.arrays = {}
+        for name, dtype in FIELDS:
+            if directory is None:
+                self.arrays[name] = np.zeros((capacity, owners), dtype=dtype)
+            else:
+                if not os.path.isdir(directory):
+                    os.makedirs(directory)
+                self.arrays[name] = np.memmap(
+                    os.path.join(directory, name + '.dat'), dtype = dtype,
+                    mode = 'w+', shape = (capacity, owners)
+                    )
+
+    def store(self, batch):
+
+        for name, values in batch.iteritems():
+            self.arrays[name][self.count:self.count + len(values)] = values
+
+        return
+
+    def values(self, name):
+
+        return self.arrays[name][:self.count]
+
+    def std(self, name):
+
+        return self.values(name).std(axis = 0, dtype = np.float64)
+
+    def quantiles(self, name, quantiles):
+        # (quantiles x owners)
+        return np.percentile(
+            self.values(name), np.multiply(quantiles, 100), axis = 0
+            )
+
+    def distribution(self, name):
+
+        values = self.values(name).astype(int)
+        size = values.max() + 1 if self.count else 1
+
+        return np.array([
+            np.bincount(values[:, row], minlength = size)
+            for row in range(self.owners)
+            ])
+
+    def state(self):
+
+        state = super(FullResults, self).state()
+        for name in self.arrays:
+            state[name] = np.asarray(self.values(name))
+
+        return state
+
+    def load_state(self, state):
+
+        super(FullResults, self).load_state(state)
+        for name in self.arrays:
+            self.arrays[name][:self.count] = state[name]
+
+        return
+
+
+class StreamingResults(ResultStore):
+    # running mean and variance merged batch by batch, and per owner
+    # histograms as quantile sketches: one bin per win or loss and one per
+    # point_resolution points, so quantiles are within one bin
+
+    def __init__(self, owners, point_resolution=0.1):
+
+        super(StreamingResults, self).__init__(owners)
+        self.resolution = {
+            'wins': 1.0, 'losses': 1.0, 'totals': point_resolution
+            }
+        self.means = dict(
+            (name, np.zeros(owners)) for name, dtype in FIELDS
+            )
+        self.m2 = dict((name, np.zeros(owners)) for name, dtype in FIELDS)
+        self.histograms = dict(
+            (name, np.zeros((owners, 1), dtype=np.int64))
+            for name, dtype in FIELDS
+            )
+
+    def store(self, batch):
+
+        for name, values in batch.iteritems():
+            values = np.asarray(values, dtype=np.float64)
+            size = len(values)
+            total = self.count + size
+            batch_mean = values.mean(axis = 0)
+            delta = batch_mean - self.means[name]
+            self.means[name] += delta * size / total
+            self.m2[name] += (
+                ((values - batch_mean) ** 2).sum(axis = 0)
+                + delta ** 2 * self.count * size / total
+                )
+            self.add_histogram(name, values)
+
+        return
+
+    def add_histogram(self, name, values):
+
+        bins = np.floor(values / self.resolution[name]).astype(np.int64)
+        np.maximum(bins, 0, out = bins)
+        histogram = self.histograms[name]
+        width = max(histogram.shape[1], bins.max() + 1)
+        if width > histogram.shape[1]:
+            histogram = np.pad(
+                histogram, ((0, 0), (0, width - histogram.shape[1])),
+                'constant'
+                )
+        flat = bins + np.arange(self.owners) * width
+        histogram += np.bincount(
+            flat.ravel(), minlength = self.owners * width
+            ).reshape(self.owners, width)
+        self.histograms[name] = histogram
+
+        return
+
+    def std(self, name):
+
+        return np.sqrt(self.m2[name] / self.count)
+
+    def quantiles(self, name, quantiles):
+        # midpoint of the bin holding each quantile, exact for wins
+        cumulative = self.histograms[name].cumsum(axis = 1)
+        bins = np.array([
+            (cumulative < quantile * self.count).sum(axis = 1)
+            for quantile in quantiles
+            ])
+        if name == 'totals':
+            return (bins + 0.5) * self.resolution[name]
+
+        return bins * self.resolution[name]
+
+    def distribution(self, name):
+
+        return self.histograms[name]
+
+    def state(self):
+
+        state = super(StreamingResults, self).state()
+        for name in self.means:
+            state['means_' + name] = self.means[name]
+            state['m2_' + name] = self.m2[name]
+            state['histogram_' + name] = self.histograms[name]
+
+        return state
+
+    def load_state(self, state):
+
+        super(StreamingResults, self).load_state(state)
+        for name in self.means:
+            self.means[name] = state['means_' + name].copy()
+            self.m2[name] = state['m2_' + name].copy()
+            self.histograms[name] = state['histogram_' + name].copy()
+
+        return
+
+
+def make_results(mode, owners, capacity, directory=None):
+
+    if mode == 'full':
+        return FullResults(owners, capacity, directory)
+    if mode == 'streaming':
+        return StreamingResults(owners)
+
+    raise ValueError('unknown results mode %s' % mode)
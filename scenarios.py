@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# conditional odds on next week's results, answered by filtering the
+# stored simulations instead of simulating again
+
+import numpy as np
+import pandas as pd
+
+
+class ScenarioStore(object):
+    # final ranks as (sims x owners) int8 and next week's results as one
+    # flag per matchup, True when the first owner of the pair won
+
+    def __init__(self, owner_names, matchups, capacity, playoff_spots=6):
+
+        self.owner_names = list(owner_names)
+        self.matchups = list(matchups)
+        self.playoff_spots = playoff_spots
+        self.count = 0
+        self.final_ranks = np.zeros(
+            (capacity, len(self.owner_names)), dtype=np.int8
+            )
+        self.matchup_results = np.zeros(
+            (capacity, len(self.matchups)), dtype=bool
+            )
+
+    def add(self, final_ranks, next_week_winners):
+
+        size = len(final_ranks)
+        self.final_ranks[self.count:self.count + size] = final_ranks
+        self.matchup_results[self.count:self.count + size] = (
+            next_week_winners[:, [first for first, second in self.matchups]]
+            )
+        self.count += size
+
+        return
+
+    def matchup_of(self, name):
+        # (matchup index, True if name is the pair's first owner)
+        if name not in self.owner_names:
+            raise ValueError('no owner named %s' % name)
+        owner = self.owner_names.index(name)
+        for index, (first, second) in enumerate(self.matchups):
+            if owner in (first, second):
+                return index, owner == first
+
+        raise ValueError('%s has no game next week' % name)
+
+    def mask(self, winners):
+        # sims where every named owner wins next week
+        mask = np.ones(self.count, dtype=bool)
+        decided = {}
+        for name in winners:
+            index, first_won = self.matchup_of(name)
+            if decided.get(index, first_won) != first_won:
+                raise ValueError(
+                    '%s and their opponent cannot both win' % name
+                    )
+            decided[index] = first_won
+            mask &= self.matchup_results[:self.count, index] == first_won
+
+        return mask
+
+    def rank_table(self, final_ranks):
+        # (owners x ranks) percentages with playoff odds, like odds_table
+        owners = len(self.owner_names)
+        counts = np.bincount(
+            (final_ranks + np.arange(owners) * owners).ravel().astype(int),
+            minlength = owners * owners
+            ).reshape(owners, owners)
+        table = pd.DataFrame(
+            counts * 100.0 / max(len(final_ranks), 1),
+            index = self.owner_names, columns = range(1, owners + 1)
+            )
+        table.index.name = 'Team'
+        table['Playoff Odds'] = (
+            table.iloc[:, :self.playoff_spots].sum(axis=1)
+            )
+
+        return table
+
+    def conditional(self, winners):
+        # rank and playoff odds given the named owners win next week, and
+        # how many simulations that is based on
+        mask = self.mask(winners)
+        final_ranks = self.final_ranks[:self.count][mask]
+
+        return self.rank_table(final_ranks), len(final_ranks)
+
+    def scenario_codes(self):
+        # each sim's next week as an integer, bit i set when the first
+        # owner of matchup i won
+        weights = 1 << np.arange(len(self.matchups))
+
+        return self.matchup_results[:self.count].dot(weights)
+
+    def scenario_label(self, code):
+
+        return ', '.join(
+            self.owner_names[first if code >> index & 1 else second]
+            for index, (first, second) in enumerate(self.matchups)
+            )
+
+    def clinch_table(self):
+        # playoff odds for every combination of next week's results, one
+        # row per combination; 100 is clinched and 0 eliminated as far as
+        # the simulations can tell, rows no sim reached are NaN
+        owners = len(self.owner_names)
+        combinations = 1 << len(self.matchups)
+        codes = self.scenario_codes()
+        made_playoffs = self.final_ranks[:self.count] < self.playoff_spots
+        sims = np.bincount(codes, minlength = combinations)
+        playoffs = np.bincount(
+            (codes[:, np.newaxis] * owners + np.arange(owners)).ravel(),
+            weights = made_playoffs.ravel(),
+            minlength = combinations * owners
+            ).reshape(combinations, owners)
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            odds = playoffs * 100.0 / sims[:, np.newaxis]
+
+        table = pd.DataFrame(
+            odds, index = [
+                self.scenario_label(code) for code in range(combinations)
+                ],
+            columns = self.owner_names
+            )
+        table.index.name = 'Winners'
+        table['Simulations'] = sims
+
+        return table
+
+    def clinch_status(self):
+        # 'clinched', 'eliminated' or 'alive' per owner and scenario
+        odds = self.clinch_table().drop('Simulations', axis = 1)
+        status = pd.DataFrame(
+            'alive', index = odds.index, columns = odds.columns
+            )
+        status[odds == 100] = 'clinched'
+        status[odds == 0] = 'eliminated'
+        status[odds.isnull()] = ''
+
+        return status
+
+    def state(self):
+
+        return {
+            'count': np.array(self.count),
+            'final_ranks': self.final_ranks[:self.count],
+            'matchup_results': self.matchup_results[:self.count],
+            }
+
+    def load_state(self, state):
+
+        self.count = int(state['count'])
+        self.final_ranks[:self.count] = state['final_ranks']
+        self.matchup_results[:self.count] = state['matchup_results']
+
+        return
@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+# long running http service that keeps leagues warm in memory and answers
+# odds, power rankings and scenario queries without a cold run
+
+import argparse
+import BaseHTTPServer
+import itertools
+import json
+import multiprocessing
+import os
+import Queue
+import SocketServer
+import threading
+import time
+import urlparse
+
+import cache
+import fetch
+from metrics import Metrics
+from player_index import PlayerIndex
+from power_rankings import ESPNSimulation
+
+
+# query parameters a recompute may change, and how to read them
+RERUN_PARAMS = {
+    'sims': ('sim_count', int),
+    'seed': ('seed', int),
+    'target_error': ('target_error', float),
+    'sampling': ('sampling', str),
+    }
+
+
+def table_records(table):
+    # a table as a list of row dicts keyed by team, NaN becomes null
+    if table.index.name is None:
+        table = table.copy()
+        table.index.name = 'Team'
+
+    return json.loads(table.reset_index().to_json(orient = 'records'))
+
+
+class LeagueView(object):
+    # the tables of one finished run; a rerun builds new tables instead of
+    # changing these, so queries read a view without any locking
+
+    def __init__(self, league_id, simulation, version):
+
+        self.league_id = league_id
+        self.version = version
+        self.odds = simulation.rank_table
+        self.rankings = simulation.output_table
+        self.scenarios = simulation.scenarios
+        self.sims_run = simulation.sims_run
+        self.seed = simulation.seed
+        self.updated = time.time()
+
+    def header(self):
+
+        return {
+            'league': self.league_id, 'version': self.version,
+            'simulations': self.sims_run, 'seed': self.seed,
+            'updated': self.updated,
+            }
+
+    def answer(self, kind, winners):
+
+        body = self.header()
+        if kind == 'odds':
+            body['table'] = table_records(self.odds)
+        elif kind == 'rankings':
+            body['table'] = table_records(self.rankings)
+        elif winners:
+            table, sims = self.scenarios.conditional(winners)
+            body['winners'] = list(winners)
+            body['scenario_simulations'] = int(sims)
+            body['table'] = table_records(table.reindex(self.odds.index))
+        else:
+            body['table'] = table_records(self.scenarios.clinch_table())
+            body['status'] = table_records(self.scenarios.clinch_status())
+
+        return json.dumps(body)
+
+
+class Job(object):
+    # a queued load or rerun of one league
+
+    def __init__(self, ID, league_id, stats_id, refresh, changes, week=False):
+
+        self.ID = ID
+        self.league_id = league_id
+        self.stats_id = stats_id
+        # refresh rebuilds the league from freshly fetched pages
+        self.refresh = refresh
+        # week folds in the week just finished instead of a full reload
+        self.week = week
+        self.changes = changes
+        self.status = 'queued'
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.done = threading.Event()
+
+    def describe(self):
+
+        return {
+            'id': self.ID, 'league': self.league_id, 'status': self.status,
+            'week': self.week, 'error': self.error, 'created': self.created,
+            'finished': self.finished, 'changes': self.changes,
+            }
+
+
+class Flight(object):
+    # an answer being built that other requests for it wait on
+
+    def __init__(self):
+
+        self.done = threading.Event()
+        self.answer = None
+        self.error = None
+
+
+class OddsService(object):
+    # warm leagues, one recompute worker and cached, coalesced answers
+
+    def __init__(
+            self, year, complete_weeks, lookback, sim_count, workers=None,
+            cache_dir='http_cache', index_path='player_index.json',
+            output_dir='leagues', offline=False, **kwargs
+            ):
+
+        self.year = year
+        self.complete_weeks = complete_weeks
+        self.lookback = lookback
+        self.sim_count = sim_count
+        self.output_dir = output_dir
+        self.kwargs = kwargs
+        self.fetcher = fetch.Fetcher(
+            cache = cache.ResponseCache(cache_dir, offline = offline)
+            )
+        self.player_index = PlayerIndex(index_path)
+        self.workers = workers or multiprocessing.cpu_count()
+        self.pool = multiprocessing.Pool(self.workers)
+        self.simulations = {}
+        self.views = {}
+        self.job_ids = itertools.count(1)
+        self.jobs = {}
+        self.pending = {}
+        self.job_lock = threading.Lock()
+        self.queue = Queue.Queue()
+        self.answers = {}
+        self.in_flight = {}
+        self.answer_lock = threading.Lock()
+        self.worker = threading.Thread(target = self.work)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def submit(
+            self, league_id, stats_id=None, refresh=False, week=False,
+            **changes
+            ):
+        # the same recompute asked for while one is queued or running
+        # shares that job instead of queueing another
+        key = (
+            league_id, stats_id, refresh, week,
+            tuple(sorted(changes.items()))
+            )
+        with self.job_lock:
+            job = self.pending.get(key)
+            if job is not None:
+                return job
+            if stats_id is None and league_id not in self.simulations:
+                raise KeyError('league %s is not loaded' % league_id)
+            job = Job(
+                next(self.job_ids), league_id, stats_id, refresh, changes,
+                week
+                )
+            self.jobs[job.ID] = job
+            self.pending[key] = job
+        self.queue.put((key, job))
+
+        return job
+
+    def work(self):
+
+        while True:
+            key, job = self.queue.get()
+            job.status = 'running'
+            try:
+                self.run_job(job)
+                job.status = 'done'
+            except Exception as error:
+                job.status = 'failed'
+                job.error = '%s: %s' % (type(error).__name__, error)
+            finally:
+                job.finished = time.time()
+                with self.job_lock:
+                    del self.pending[key]
+                job.done.set()
+
+    def run_job(self, job):
+
+        simulation = self.simulations.get(job.league_id)
+        if simulation is None or job.refresh or job.stats_id is not None:
+            league_dir = os.path.join(self.output_dir, job.league_id)
+            kwargs = dict(self.kwargs)
+            kwargs.update(job.changes)
+            # a rebuild keeps any weeks the league was advanced by since
+            # the service started
+            complete_weeks = (
+                self.complete_weeks if simulation is None
+                else simulation.complete_weeks
+                )
+            simulation = ESPNSimulation(
+                job.league_id,
+                job.stats_id or simulation.stats_id,
+                self.year, complete_weeks, self.lookback,
+                kwargs.pop('sim_count', self.sim_count),
+                fetcher = self.fetcher, player_index = self.player_index,
+                workers = self.workers, pool = self.pool,
+                output_dir = league_dir,
+                metrics = Metrics([]), keep_scenarios = True,
+                refresh = job.refresh, **kwargs
+                )
+        elif job.week:
+            for name, value in job.changes.iteritems():
+                setattr(simulation, name, value)
+            simulation.update_week()
+        else:
+            simulation.rerun(**job.changes)
+        self.player_index.save()
+
+        previous = self.views.get(job.league_id)
+        self.simulations[job.league_id] = simulation
+        self.views[job.league_id] = LeagueView(
+            job.league_id, simulation, previous.version + 1 if previous else 1
+            )
+
+        return
+
+    def answer(self, league_id, kind, winners=()):
+        # json text for a query, built once per league version and shared
+        # by every request that asks while it is being built
+        view = self.views.get(league_id)
+        if view is None:
+            raise KeyError('league %s is not loaded' % league_id)
+        key = (league_id, view.version, kind, tuple(sorted(winners)))
+
+        with self.answer_lock:
+            if key in self.answers:
+                return self.answers[key]
+            flight = self.in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.in_flight[key] = Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.answer
+
+        try:
+            flight.answer = view.answer(kind, winners)
+            with self.answer_lock:
+                # answers for older versions of this league are dropped
+                for old in [
+                        old for old in self.answers
+                        if old[0] == league_id and old[1] != view.version
+                        ]:
+                    del self.answers[old]
+                self.answers[key] = flight.answer
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self.answer_lock:
+                del self.in_flight[key]
+            flight.done.set()
+
+        return flight.answer
+
+    def leagues(self):
+
+        return json.dumps([
+            view.header() for league_id, view in sorted(self.views.items())
+            ])
+
+    def close(self):
+
+        self.pool.terminate()
+        self.pool.join()
+        self.player_index.save()
+        self.fetcher.close()
+
+        return
+
+
+class ServiceHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # GET  /leagues
+    # GET  /leagues/<id>/odds, /rankings, /scenarios[?winner=..&winner=..]
+    # POST /leagues/<id>[?stats_id=..&sims=..&seed=..&refresh=1|week=1]
+    # GET  /jobs/<id>
+
+    def route(self):
+
+        url = urlparse.urlparse(self.path)
+        parts = [part for part in url.path.split('/') if part]
+
+        return parts, urlparse.parse_qs(url.query)
+
+    def do_GET(self):
+
+        parts, query = self.route()
+        service = self.server.service
+        try:
+            if parts == ['leagues']:
+                return self.send_json(200, service.leagues())
+            if (
+                    len(parts) == 3 and parts[0] == 'leagues'
+                    and parts[2] in ('odds', 'rankings', 'scenarios')
+                    ):
+                winners = [
+                    winner.decode('utf-8')
+                    for winner in query.get('winner', [])
+                    ]
+                return self.send_json(
+                    200, service.answer(parts[1], parts[2], winners)
+                    )
+            if len(parts) == 2 and parts[0] == 'jobs':
+                job = service.jobs.get(int(parts[1]))
+                if job is not None:
+                    return self.send_json(200, json.dumps(job.describe()))
+        except KeyError as error:
+            return self.send_error_json(404, error.args[0])
+        except ValueError as error:
+            return self.send_error_json(400, str(error))
+
+        return self.send_error_json(404, 'no such resource')
+
+    def do_POST(self):
+
+        parts, query = self.route()
+        if len(parts) != 2 or parts[0] != 'leagues':
+            return self.send_error_json(404, 'no such resource')
+        try:
+            changes = dict(
+                (RERUN_PARAMS[name][0], RERUN_PARAMS[name][1](values[-1]))
+                for name, values in query.iteritems() if name in RERUN_PARAMS
+                )
+            job = self.server.service.submit(
+                parts[1], query.get('stats_id', [None])[-1],
+                query.get('refresh', ['0'])[-1] == '1',
+                query.get('week', ['0'])[-1] == '1', **changes
+                )
+        except KeyError as error:
+            return self.send_error_json(404, error.args[0])
+        except ValueError as error:
+            return self.send_error_json(400, str(error))
+
+        return self.send_json(202, json.dumps(job.describe()))
+
+    def send_json(self, status, text):
+
+        body = text.encode('utf-8') if isinstance(text, unicode) else text
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+        return
+
+    def send_error_json(self, status, message):
+
+        return self.send_json(status, json.dumps({'error': message}))
+
+    def log_message(self, format, *args):
+
+        return
+
+
+class ServiceServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address, service):
+
+        BaseHTTPServer.HTTPServer.__init__(self, address, ServiceHandler)
+        self.service = service
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description = 'Serve playoff odds for warm leagues over http.'
+        )
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8080)
+    parser.add_argument('--year', default = '2017')
+    parser.add_argument('--complete-weeks', type = int, default = 6)
+    parser.add_argument('--lookback', type = int, default = 12)
+    parser.add_argument('--sims', type = int, default = 100000)
+    parser.add_argument('--workers', type = int)
+    parser.add_argument(
+        '--league', action = 'append', default = [],
+        help = 'league_id:stats_id to load at startup, may be repeated'
+        )
+    parser.add_argument(
+        '--offline', action = 'store_true',
+        help = 'serve only cached pages, failing on any that are missing'
+        )
+    args = parser.parse_args()
+
+    service = OddsService(
+        args.year, args.complete_weeks, args.lookback, args.sims,
+        workers = args.workers, offline = args.offline
+        )
+    for league in args.league:
+        league_id, stats_id = league.split(':')
+        service.submit(league_id, stats_id)
+    server = ServiceServer((args.host, args.port), service)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
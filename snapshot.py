@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+# versioned .npz snapshot of the scraped league state
+
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+
+SNAPSHOT_VERSION = 1
+
+# manifest fields that must match the Simulation loading a snapshot
+LEAGUE_KEYS = ('league_id', 'stats_id', 'year', 'complete_weeks')
+
+
+def flatten(lists):
+    # ragged lists become one flat array plus offsets into it
+    offsets = np.cumsum([0] + [len(values) for values in lists])
+    flat = [value for values in lists for value in values]
+
+    return flat, offsets
+
+
+def unflatten(flat, offsets):
+
+    return [
+        flat[start:end].tolist()
+        for start, end in zip(offsets[:-1], offsets[1:])
+        ]
+
+
+def save_snapshot(simulation, path):
+    # owners are saved in standings order so rank_table rebuilds the same
+    owners = sorted(
+        simulation.owner_list, key = lambda owner: owner.current_rank
+        )
+    players = [
+        (row, player)
+        for row, owner in enumerate(owners)
+        for player in owner.roster
+        ]
+    scores, score_offsets = flatten([owner.scores for owner in owners])
+    opponents, opponent_offsets = flatten(
+        [owner.final_opponents for owner in owners]
+        )
+    game_scores, game_offsets = flatten(
+        [player.game_scores for row, player in players]
+        )
+    teams = sorted(simulation.team_dict.keys())
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'created': time.time(),
+        'league_id': simulation.league_id,
+        'stats_id': simulation.stats_id,
+        'year': simulation.year,
+        'complete_weeks': simulation.complete_weeks,
+        }
+
+    np.savez_compressed(
+        path,
+        manifest = np.array(json.dumps(manifest)),
+        owner_names = np.array(
+            [owner.name_complex for owner in owners], dtype=unicode
+            ),
+        owner_ids = np.array([owner.ID for owner in owners], dtype=unicode),
+        owner_wins = np.array([owner.wins for owner in owners]),
+        owner_losses = np.array([owner.losses for owner in owners]),
+        owner_ranks = np.array([owner.current_rank for owner in owners]),
+        scores = np.array(scores, dtype=float),
+        score_offsets = score_offsets,
+        opponents = np.array(opponents, dtype=unicode),
+        opponent_offsets = opponent_offsets,
+        player_owners = np.array([row for row, player in players], dtype=int),
+        player_names = np.array(
+            [player.player_name for row, player in players], dtype=unicode
+            ),
+        player_positions = np.array(
+            [player.position for row, player in players], dtype=unicode
+            ),
+        player_teams = np.array(
+            [player.full_team or '' for row, player in players],
+            dtype=unicode
+            ),
+        player_abbrs = np.array(
+            [player.abbr_team or '' for row, player in players],
+            dtype=unicode
+            ),
+        game_scores = np.array(game_scores, dtype=float),
+        game_offsets = game_offsets,
+        teams = np.array(teams, dtype=unicode),
+        team_abbrs = np.array(
+            [simulation.team_dict[team] for team in teams], dtype=unicode
+            ),
+        defense_values = simulation.defense_matrix.values.astype(float),
+        defense_teams = np.array(
+            list(simulation.defense_matrix.index), dtype=unicode
+            ),
+        defense_positions = np.array(
+            list(simulation.defense_matrix.columns), dtype=unicode
+            ),
+        schedule = simulation.schedule_table.values.astype(unicode),
+        schedule_teams = np.array(
+            list(simulation.schedule_table.index), dtype=unicode
+            ),
+        )
+
+    return
+
+
+def check_manifest(manifest, expected, path):
+
+    for key in LEAGUE_KEYS:
+        if manifest.get(key) != expected[key]:
+            raise ValueError(
+                'snapshot %s was saved with %s=%r, this run has %r'
+                % (path, key, manifest.get(key), expected[key])
+                )
+
+    return
+
+
+def load_snapshot(path, expected=None):
+    # expected holds the LEAGUE_KEYS of the run, a snapshot of another
+    # league or week is refused
+    data = np.load(path)
+    manifest = json.loads(data['manifest'].item())
+    if manifest['version'] != SNAPSHOT_VERSION:
+        raise ValueError(
+            'unsupported snapshot version %s in %s'
+            % (manifest['version'], path)
+            )
+    if expected is not None:
+        check_manifest(manifest, expected, path)
+
+    # owners and players come back as plain dicts, Simulation rebuilds the
+    # Owner and Player objects from them
+    rosters = [[] for name in data['owner_names']]
+    for row, name, position, team, abbr, game_scores in zip(
+            data['player_owners'].tolist(), data['player_names'].tolist(),
+            data['player_positions'].tolist(), data['player_teams'].tolist(),
+            data['player_abbrs'].tolist(),
+            unflatten(data['game_scores'], data['game_offsets'])
+            ):
+        rosters[row].append({
+            'player_name': name, 'position': position,
+            'full_team': team or None, 'abbr_team': abbr or None,
+            'game_scores': game_scores,
+            })
+
+    owners = []
+    for name, ID, wins, losses, rank, scores, opponents, roster in zip(
+            data['owner_names'].tolist(), data['owner_ids'].tolist(),
+            data['owner_wins'].tolist(), data['owner_losses'].tolist(),
+            data['owner_ranks'].tolist(),
+            unflatten(data['scores'], data['score_offsets']),
+            unflatten(data['opponents'], data['opponent_offsets']),
+            rosters
+            ):
+        owners.append({
+            'name_complex': name, 'ID': ID, 'wins': wins, 'losses': losses,
+            'rank': rank, 'scores': scores, 'final_opponents': opponents,
+            'roster': roster,
+            })
+
+    team_dict = dict(zip(data['teams'].tolist(), data['team_abbrs'].tolist()))
+    defense_matrix = pd.DataFrame(
+        data['defense_values'], index = data['defense_teams'].tolist(),
+        columns = data['defense_positions'].tolist()
+        )
+    schedule_table = pd.DataFrame(
+        data['schedule'], index = data['schedule_teams'].tolist(),
+        columns = range(1, 18)
+        )
+
+    return {
+        'manifest': manifest,
+        'owners': owners,
+        'team_dict': team_dict,
+        'defense_matrix': defense_matrix,
+        'schedule_table': schedule_table,
+        }
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+# scrambled sobol points in numpy alone, since scipy.stats.qmc needs scipy
+# 1.7 and python 3; dimension one is van der Corput and dimension j after
+# it follows the j-th primitive polynomial over GF(2), with initial
+# direction numbers from a fixed stream rather than Joe and Kuo's tables,
+# and every sequence gets a random linear matrix scramble and digital shift
+
+import numpy as np
+
+# binary digits per point, so a sequence holds up to 2 ** 31 points
+BITS = 31
+
+# (degree, polynomial bit mask) of every primitive polynomial found so far
+polynomials = []
+# (dimensions x BITS) direction numbers, grown as more dimensions are asked
+directions = np.zeros((0, BITS), dtype=np.int64)
+
+
+def multiply_mod(a, b, polynomial, degree):
+    # a * b modulo polynomial, everything as GF(2) bit masks
+    product = 0
+    while b:
+        if b & 1:
+            product ^= a
+        b >>= 1
+        a <<= 1
+        if a >> degree & 1:
+            a ^= polynomial
+
+    return product
+
+
+def power_mod(exponent, polynomial, degree):
+    # x ** exponent modulo polynomial
+    result = 1
+    base = 2
+    while exponent:
+        if exponent & 1:
+            result = multiply_mod(result, base, polynomial, degree)
+        base = multiply_mod(base, base, polynomial, degree)
+        exponent >>= 1
+
+    return result
+
+
+def prime_factors(number):
+
+    factors = []
+    divisor = 2
+    while divisor * divisor <= number:
+        if number % divisor == 0:
+            factors.append(divisor)
+            while number % divisor == 0:
+                number //= divisor
+        divisor += 1
+    if number > 1:
+        factors.append(number)
+
+    return factors
+
+
+def find_polynomials(count):
+    # extends polynomials to count entries, by degree then value; a
+    # polynomial is primitive when x has order 2 ** degree - 1 modulo it
+    degree = polynomials[-1][0] if polynomials else 1
+    start = polynomials[-1][1] + 2 if polynomials else 3
+    while len(polynomials) < count:
+        period = 2 ** degree - 1
+        factors = prime_factors(period)
+        for polynomial in range(start, 2 ** (degree + 1), 2):
+            if power_mod(period, polynomial, degree) == 1 and all(
+                    power_mod(period // factor, polynomial, degree) != 1
+                    for factor in factors
+                    ):
+                polynomials.append((degree, polynomial))
+                if len(polynomials) == count:
+                    return
+        degree += 1
+        start = 2 ** degree + 1
+
+    return
+
+
+def direction_numbers(dimensions):
+    # the first dimensions rows of the shared direction number table
+    global directions
+
+    if len(directions) >= dimensions:
+        return directions[:dimensions]
+
+    find_polynomials(dimensions - 1)
+    table = np.zeros((dimensions, BITS), dtype=np.int64)
+    table[0] = [1 << (BITS - 1 - bit) for bit in range(BITS)]
+    initial = np.random.RandomState(0)
+    for row, (degree, polynomial) in enumerate(polynomials[:dimensions - 1]):
+        numbers = [
+            2 * initial.randint(2 ** bit) + 1 for bit in range(degree)
+            ]
+        for bit in range(degree, BITS):
+            number = numbers[bit - degree] ^ numbers[bit - degree] << degree
+            for step in range(1, degree):
+                if polynomial >> (degree - step) & 1:
+                    number ^= numbers[bit - step] << step
+            numbers.append(number)
+        table[row + 1] = [
+            numbers[bit] << (BITS - 1 - bit) for bit in range(BITS)
+            ]
+    directions = table
+
+    return directions
+
+
+def scrambled_points(count, dimensions, rng):
+    # (count x dimensions) points in (0, 1) of one scrambled sequence
+    used = max(int(count - 1).bit_length(), 1)
+    if used > BITS:
+        raise ValueError('a sobol sequence holds at most 2 ** %d points' % BITS)
+    numbers = direction_numbers(dimensions)[:, :used]
+
+    # each dimension's numbers, as binary digits most significant first,
+    # go through a random lower unit triangular matrix
+    shifts = np.arange(BITS - 1, -1, -1)
+    digits = numbers[:, :, np.newaxis] >> shifts & 1
+    scramble = np.tril(rng.randint(2, size = (dimensions, BITS, BITS)), -1)
+    scramble[:, np.arange(BITS), np.arange(BITS)] = 1
+    digits = np.einsum('drc,dbc->dbr', scramble, digits) & 1
+    numbers = (digits << shifts).sum(axis = 2)
+
+    # gray code order, point i is the xor of the numbers of gray(i)'s bits
+    index = np.arange(count, dtype=np.int64)
+    gray = index ^ index >> 1
+    points = np.zeros((count, dimensions), dtype=np.int64)
+    for bit in range(used):
+        points[(gray >> bit & 1).astype(bool)] ^= numbers[:, bit]
+    points ^= rng.randint(2 ** BITS, size = dimensions)
+
+    return (points + 0.5) / 2.0 ** BITS
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# a run interrupted and resumed from its checkpoint must match a straight run
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from benchmark import SyntheticLeague
+from metrics import Metrics
+from player_index import PlayerIndex
+from power_rankings import ESPNSimulation
+from test_update_week import LeagueFetcher
+
+
+class Interrupted(Exception):
+
+    pass
+
+
+class InterruptingMetrics(Metrics):
+    # raises in the middle of the run once `batches` batches are merged,
+    # before that batch's checkpoint is written
+
+    def __init__(self, batches):
+
+        super(InterruptingMetrics, self).__init__([])
+        self.batches = batches
+
+    def progress(self, completed):
+
+        self.batches -= 1
+        if self.batches == 0:
+            raise Interrupted()
+        super(InterruptingMetrics, self).progress(completed)
+
+        return
+
+
+class ResumeTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.output_dir = tempfile.mkdtemp(prefix = 'power_rankings_test')
+        self.checkpoint = os.path.join(self.output_dir, 'checkpoint.npz')
+        league = SyntheticLeague(teams = 8, roster_size = 10, weeks_played = 6)
+        self.league = league
+        self.fetcher = LeagueFetcher(league.build_pages(), 6)
+        self.fetcher.released = True
+
+    def tearDown(self):
+
+        self.fetcher.close()
+        shutil.rmtree(self.output_dir, ignore_errors = True)
+
+    def simulate(self, **kwargs):
+
+        kwargs.setdefault('metrics', Metrics([]))
+        return ESPNSimulation(
+            self.league.league_id, self.league.stats_id, self.league.year, 6,
+            12, 10000, seed = 1, batch_size = 100, fetcher = self.fetcher,
+            player_index = PlayerIndex(), output_dir = self.output_dir,
+            output_format = 'csv', **kwargs
+            )
+
+    def interrupted_and_resumed(self, batches, workers=1, **kwargs):
+
+        with self.assertRaises(Interrupted):
+            self.simulate(
+                checkpoint = self.checkpoint, checkpoint_interval = 0,
+                metrics = InterruptingMetrics(batches), **kwargs
+                )
+
+        return self.simulate(
+            checkpoint = self.checkpoint, resume = True, workers = workers,
+            **kwargs
+            )
+
+    def assertSameRun(self, resumed, straight):
+
+        self.assertEqual(resumed.sims_run, straight.sims_run)
+        np.testing.assert_array_equal(
+            resumed.rank_table.values.astype(float),
+            straight.rank_table.values.astype(float)
+            )
+        for name in ('wins', 'losses', 'totals'):
+            np.testing.assert_allclose(
+                resumed.results.mean(name), straight.results.mean(name)
+                )
+            np.testing.assert_allclose(
+                resumed.results.quantiles(name, [0.1, 0.5, 0.9]),
+                straight.results.quantiles(name, [0.1, 0.5, 0.9])
+                )
+
+    def test_resume_matches_a_straight_run(self):
+
+        straight = self.simulate()
+        resumed = self.interrupted_and_resumed(37)
+
+        self.assertEqual(straight.sims_run, 10000)
+        self.assertSameRun(resumed, straight)
+
+    def test_resume_stops_where_a_straight_run_stops(self):
+        # errors are around 50 / sqrt(sims) at most, so this stops long
+        # before the cap
+        straight = self.simulate(target_error = 1.0)
+        resumed = self.interrupted_and_resumed(8, target_error = 1.0)
+
+        self.assertLess(straight.sims_run, 10000)
+        self.assertSameRun(resumed, straight)
+
+    def test_streaming_resume_on_more_workers(self):
+
+        straight = self.simulate(results_mode = 'streaming')
+        resumed = self.interrupted_and_resumed(
+            23, workers = 3, results_mode = 'streaming'
+            )
+
+        self.assertSameRun(resumed, straight)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# the batched engine on small leagues whose outcomes can be worked by hand
+
+import multiprocessing
+import unittest
+
+import numpy as np
+
+import engine
+import kernels
+from benchmark import round_robin
+
+
+def league_simulator(owners=8, weeks=4, slots=3, deviation=5.0, **kwargs):
+    # a round robin league with distinct lineups, so no two owners tie
+    rng = np.random.RandomState(0)
+    opponents = np.empty((owners, weeks), dtype=int)
+    for week, games in enumerate(round_robin(owners, weeks)):
+        for home, away in games:
+            opponents[home, week] = away
+            opponents[away, week] = home
+    lineup_scores = (
+        rng.uniform(5, 20, (owners, weeks, slots))
+        + np.arange(owners)[:, np.newaxis, np.newaxis] * 0.37
+        )
+
+    return engine.BatchSimulator(
+        lineup_scores, np.full(lineup_scores.shape, deviation), opponents,
+        rng.randint(2, 6, owners), rng.randint(2, 6, owners),
+        rng.uniform(500, 700, owners), np.full(owners, 13.0), 7, **kwargs
+        )
+
+
+class DrawTest(unittest.TestCase):
+
+    def test_zero_deviation_draws_are_censored_lineup_sums(self):
+
+        lineup_scores = np.array([[[10.0, -2.0], [3.0, 4.0]]])
+        totals = engine.draw_point_totals(
+            lineup_scores, np.zeros_like(lineup_scores), 3,
+            np.random.RandomState(0)
+            )
+
+        self.assertEqual(totals.shape, (3, 1, 2))
+        np.testing.assert_array_equal(totals, [[[10.0, 7.0]]] * 3)
+
+    def test_play_games(self):
+        # owner 0 beats 1 and then 2, owners 2 and 3 tie, and owners 1
+        # and 3 have no game in week two
+        weekly_points = np.array([[
+            [10.0, 5.0], [8.0, 9.0], [7.0, 1.0], [7.0, 2.0]
+            ]])
+        opponents = np.array([[1, 2], [0, -1], [3, 0], [2, -1]])
+        wins, losses = engine.play_games(weekly_points, opponents)
+
+        np.testing.assert_array_equal(wins, [[2, 0, 0, 0]])
+        np.testing.assert_array_equal(losses, [[0, 1, 1, 0]])
+
+    def test_split_batches(self):
+
+        self.assertEqual(
+            engine.split_batches(25, 10), [(0, 10), (1, 10), (2, 5)]
+            )
+
+
+class RankingTest(unittest.TestCase):
+
+    def test_win_percentage_ties_go_to_points(self):
+        # owners 0 and 2 are both .500, owner 2 has more points
+        rankings = engine.rank_owners(
+            np.array([[0.5, 0.75, 0.5, 0.25]]),
+            np.array([[100.0, 90.0, 120.0, 200.0]])
+            )
+
+        np.testing.assert_array_equal(rankings, [[1, 2, 0, 3]])
+
+    def test_wild_card_promotes_the_top_scorer_outside_the_top_five(self):
+
+        rankings = np.array([range(8)])
+        points = np.array([[200, 190, 180, 170, 160, 50, 60, 300]])
+        engine.wild_card(rankings, points)
+
+        np.testing.assert_array_equal(rankings, [[0, 1, 2, 3, 4, 7, 5, 6]])
+
+    def test_wild_card_when_the_top_scorer_is_in_the_top_five(self):
+        # the best of the rest is promoted, here owner 6
+        rankings = np.array([range(8)])
+        points = np.array([[400, 190, 180, 170, 160, 50, 60, 55]])
+        engine.wild_card(rankings, points)
+
+        np.testing.assert_array_equal(rankings, [[0, 1, 2, 3, 4, 6, 5, 7]])
+
+    def test_wild_card_leaves_a_sixth_place_leader(self):
+
+        rankings = np.array([range(8)])
+        points = np.array([[200, 190, 180, 170, 160, 150, 60, 55]])
+        engine.wild_card(rankings, points)
+
+        np.testing.assert_array_equal(rankings, [range(8)])
+
+    def test_rank_histogram(self):
+        # counts[owner, place] over three sims
+        counts = engine.rank_histogram(
+            np.array([[1, 0, 2], [0, 1, 2], [1, 0, 2]])
+            )
+
+        np.testing.assert_array_equal(
+            counts, [[1, 2, 0], [2, 1, 0], [0, 0, 3]]
+            )
+
+    def test_final_ranks_invert_rankings(self):
+
+        ranks = engine.final_ranks(np.array([[2, 0, 1]]))
+
+        np.testing.assert_array_equal(ranks, [[1, 2, 0]])
+
+
+class WorkerTest(unittest.TestCase):
+    # a seed gives the same sims however batches are spread over workers
+
+    def setUp(self):
+
+        self.simulator = league_simulator()
+        self.batches = engine.split_batches(2500, 400)
+
+    def assertSameResults(self, results, expected):
+
+        self.assertEqual(len(results), len(expected))
+        for batch, expected_batch in zip(results, expected):
+            for values, expected_values in zip(batch[:4], expected_batch[:4]):
+                np.testing.assert_array_equal(values, expected_values)
+
+    def test_one_and_three_workers_agree(self):
+
+        expected = [self.simulator.run_batch(*batch) for batch in self.batches]
+        pool = multiprocessing.Pool(
+            3, engine.init_worker, (self.simulator,)
+            )
+        try:
+            results = pool.map(engine.run_worker_batch, self.batches)
+        finally:
+            pool.terminate()
+            pool.join()
+
+        self.assertSameResults(results, expected)
+
+    def test_shared_pool_window_agrees(self):
+
+        expected = [self.simulator.run_batch(*batch) for batch in self.batches]
+        pool = multiprocessing.Pool(3)
+        try:
+            results = list(engine.windowed_imap(
+                pool, engine.run_league_batch,
+                ((self.simulator,) + batch for batch in self.batches), 6
+                ))
+        finally:
+            pool.terminate()
+            pool.join()
+
+        self.assertSameResults(results, expected)
+
+
+@unittest.skipUnless(kernels.numba is not None, 'needs numba installed')
+class BackendTest(unittest.TestCase):
+
+    def test_backends_agree_without_deviation(self):
+        # with nothing random left both backends play the same season
+        results = [
+            league_simulator(deviation = 0.0, backend = backend).simulate(
+                0, 50
+                )
+            for backend in ('numpy', 'numba')
+            ]
+        (rankings, wins, losses, totals), (
+            fused_rankings, fused_wins, fused_losses, fused_totals
+            ) = [result[:4] for result in results]
+
+        np.testing.assert_array_equal(fused_rankings, rankings)
+        np.testing.assert_array_equal(fused_wins, wins)
+        np.testing.assert_array_equal(fused_losses, losses)
+        # the kernel adds slot by slot, numpy a whole axis at a time
+        np.testing.assert_allclose(fused_totals, totals)
+
+
+if __name__ == '__main__':
+    unittest.main()
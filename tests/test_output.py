@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# every result writer must produce a table that reads back the same
+
+import importlib
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+import output
+
+
+def parquet_engine():
+
+    for engine in ('pyarrow', 'fastparquet'):
+        try:
+            importlib.import_module(engine)
+        except ImportError:
+            continue
+        return engine
+
+    return None
+
+
+class WriterTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.output_dir = tempfile.mkdtemp(prefix = 'power_rankings_test')
+        # shaped like the playoff odds table, with int rank columns
+        self.table = pd.DataFrame(
+            [[1, 62.5, 37.5, 100.0, 0.0], [2, 37.5, 62.5, 100.0, 0.0]],
+            index = ['Team A', 'Team B'],
+            columns = ['Current', 1, 2, 'Playoff Odds', 'Playoff Odds SE']
+            )
+        self.table.index.name = 'Team'
+
+    def tearDown(self):
+
+        shutil.rmtree(self.output_dir, ignore_errors = True)
+
+    @unittest.skipUnless(
+        hasattr(pd.DataFrame, 'to_parquet') and parquet_engine(),
+        'parquet output needs pandas >= 0.21 with pyarrow or fastparquet'
+        )
+    def test_parquet_round_trip(self):
+
+        writer = output.make_writer('parquet', self.output_dir)
+        path = writer.write('playoff_odds', self.table)
+        table = pd.read_parquet(path).set_index('Team')
+
+        self.assertEqual(
+            list(table.columns),
+            [str(column) for column in self.table.columns]
+            )
+        self.assertEqual(list(table.index), list(self.table.index))
+        self.assertEqual(
+            table.values.tolist(), self.table.values.tolist()
+            )
+
+    def test_csv_round_trip(self):
+
+        writer = output.make_writer('csv', self.output_dir)
+        path = writer.write('playoff_odds', self.table)
+        table = pd.read_csv(path, index_col = 'Team')
+
+        self.assertEqual(
+            table.values.tolist(), self.table.values.tolist()
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
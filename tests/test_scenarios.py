@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# clinch tables and status from a handful of stored sims, worked by hand
+
+import json
+import unittest
+
+import numpy as np
+
+from scenarios import ScenarioStore
+from service import LeagueView
+
+
+def hand_store():
+    # A plays B and C plays D next week, two playoff spots; A makes the
+    # playoffs in every sim, D only when D wins
+    store = ScenarioStore(['A', 'B', 'C', 'D'], [(0, 1), (2, 3)], 5, 2)
+    final_ranks = np.array([
+        [0, 2, 1, 3],
+        [1, 3, 0, 2],
+        [0, 3, 2, 1],
+        [1, 0, 2, 3],
+        [0, 1, 2, 3],
+        ])
+    winners = np.array([
+        [True, False, True, False],
+        [True, False, True, False],
+        [True, False, False, True],
+        [False, True, True, False],
+        [True, False, True, False],
+        ])
+    store.add(final_ranks, winners)
+
+    return store
+
+
+class ClinchTest(unittest.TestCase):
+
+    def test_clinch_status(self):
+
+        status = hand_store().clinch_status()
+
+        self.assertEqual(
+            status.loc['A, C'].tolist(),
+            ['clinched', 'alive', 'alive', 'eliminated']
+            )
+        self.assertEqual(
+            status.loc['A, D'].tolist(),
+            ['clinched', 'eliminated', 'eliminated', 'clinched']
+            )
+        self.assertEqual(
+            status.loc['B, C'].tolist(),
+            ['clinched', 'clinched', 'eliminated', 'eliminated']
+            )
+        # no sim had both B and D winning
+        self.assertEqual(status.loc['B, D'].tolist(), [''] * 4)
+
+    def test_scenarios_answer_carries_status(self):
+
+        class Finished(object):
+
+            rank_table = None
+            output_table = None
+            scenarios = hand_store()
+            sims_run = 5
+            seed = 1
+
+        body = json.loads(
+            LeagueView('1', Finished(), 1).answer('scenarios', ())
+            )
+        status = dict((row['Winners'], row) for row in body['status'])
+
+        self.assertEqual(status['A, C']['D'], 'eliminated')
+        self.assertEqual(status['B, C']['B'], 'clinched')
+        self.assertEqual(len(body['table']), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# each kind of recompute job must leave the warm league in the right state
+
+import shutil
+import tempfile
+import unittest
+
+from benchmark import SyntheticLeague
+from power_rankings import Simulation
+from service import OddsService
+from test_update_week import LeagueFetcher
+
+
+class RecordingFetcher(LeagueFetcher):
+    # remembers the refresh flag every page was asked for with
+
+    def __init__(self, pages, week):
+
+        super(RecordingFetcher, self).__init__(pages, week)
+        self.calls = []
+
+    def get(self, url, refresh=False):
+
+        self.calls.append((url, refresh))
+
+        return super(RecordingFetcher, self).get(url, refresh)
+
+
+class ServiceJobTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.output_dir = tempfile.mkdtemp(prefix = 'power_rankings_test')
+        league = SyntheticLeague(teams = 6, roster_size = 10, weeks_played = 7)
+        self.league = league
+        self.service = OddsService(
+            league.year, 6, 12, 2000, workers = 1,
+            cache_dir = self.output_dir + '/http_cache',
+            index_path = self.output_dir + '/player_index.json',
+            output_dir = self.output_dir, seed = 1, output_format = 'csv'
+            )
+        # jobs run through the service's fetcher, so swap in the fixtures
+        self.service.fetcher.close()
+        self.fetcher = RecordingFetcher(league.build_pages(), 7)
+        self.service.fetcher = self.fetcher
+        self.run_job(stats_id = league.stats_id)
+        self.simulation = self.service.simulations[league.league_id]
+        self.fetcher.calls = []
+
+    def tearDown(self):
+
+        self.service.close()
+        shutil.rmtree(self.output_dir, ignore_errors = True)
+
+    def run_job(self, **kwargs):
+
+        job = self.service.submit(self.league.league_id, **kwargs)
+        job.done.wait()
+        self.assertEqual(job.status, 'done', job.error)
+
+        return job
+
+    def test_refresh_fetches_past_the_cache(self):
+
+        key = (self.league.year, 6, self.league.stats_id)
+        defense = Simulation.defense_cache[key]
+        self.run_job(refresh = True)
+
+        simulation = self.service.simulations[self.league.league_id]
+        self.assertIsNot(simulation, self.simulation)
+        self.assertIn(
+            (simulation.standings_url(), True), self.fetcher.calls
+            )
+        self.assertIsNot(Simulation.defense_cache[key], defense)
+        self.assertFalse(simulation.refresh)
+        self.assertEqual(self.service.views[self.league.league_id].version, 2)
+
+    def test_week_folds_in_the_new_week(self):
+
+        self.fetcher.released = True
+        self.run_job(week = True)
+
+        simulation = self.service.simulations[self.league.league_id]
+        self.assertIs(simulation, self.simulation)
+        self.assertEqual(simulation.complete_weeks, 7)
+        self.assertIn(
+            (simulation.standings_url(), True), self.fetcher.calls
+            )
+        self.assertEqual(self.service.views[self.league.league_id].version, 2)
+
+    def test_rerun_fetches_nothing(self):
+
+        self.run_job(seed = 2)
+
+        simulation = self.service.simulations[self.league.league_id]
+        self.assertIs(simulation, self.simulation)
+        self.assertEqual(simulation.seed, 2)
+        self.assertEqual(self.fetcher.calls, [])
+        self.assertEqual(self.service.views[self.league.league_id].version, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# folding a finished week into a loaded league must match scraping it fresh
+
+import re
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import cache
+import fetch
+from benchmark import SyntheticLeague
+from metrics import Metrics
+from player_index import PlayerIndex
+from power_rankings import ESPNSimulation
+
+
+class LeagueFetcher(fetch.Fetcher):
+    # serves a synthetic league's pages, with the last game of this season
+    # cut from every player's log until the week is released
+
+    def __init__(self, pages, week):
+
+        super(LeagueFetcher, self).__init__(max_workers = 4)
+        self.pages = pages
+        self.hidden_game = re.compile(
+            r'<tr><td class="sort1">%d</td>.*?</tr>' % week
+            )
+        self.released = False
+
+    def get(self, url, refresh=False):
+
+        final_url, text = self.pages[url]
+        if not self.released and 'Gamelog' in text:
+            text = self.hidden_game.sub('', text, count = 1)
+
+        return cache.CachedResponse(final_url, unicode(text))
+
+
+class UpdateWeekTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.output_dir = tempfile.mkdtemp(prefix = 'power_rankings_test')
+        league = SyntheticLeague(teams = 6, roster_size = 10, weeks_played = 7)
+        self.league = league
+        self.fetcher = LeagueFetcher(league.build_pages(), 7)
+
+    def tearDown(self):
+
+        self.fetcher.close()
+        shutil.rmtree(self.output_dir, ignore_errors = True)
+
+    def simulate(self, complete_weeks):
+
+        return ESPNSimulation(
+            self.league.league_id, self.league.stats_id, self.league.year,
+            complete_weeks, 12, 2000, seed = 1, fetcher = self.fetcher,
+            player_index = PlayerIndex(), output_dir = self.output_dir,
+            metrics = Metrics([]), output_format = 'csv'
+            )
+
+    def test_update_week_matches_fresh_scrape(self):
+
+        simulation = self.simulate(6)
+        self.fetcher.released = True
+        simulation.update_week()
+        fresh = self.simulate(7)
+
+        self.assertEqual(simulation.complete_weeks, 7)
+        for player, fresh_player in zip(
+                simulation.player_list, fresh.player_list
+                ):
+            self.assertEqual(player.game_scores, fresh_player.game_scores)
+            self.assertEqual(player.season_games, fresh_player.season_games)
+            self.assertAlmostEqual(
+                player.scoring_average, fresh_player.scoring_average
+                )
+        for position, totals in fresh.position_totals.iteritems():
+            np.testing.assert_allclose(
+                simulation.position_totals[position], totals
+                )
+        np.testing.assert_allclose(
+            simulation.rank_table.values.astype(float),
+            fresh.rank_table.values.astype(float)
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()